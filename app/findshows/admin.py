@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 
-from .models import Artist, ArtistLinkingInfo, CustomText, ListenLink, MusicBrainzArtist, UserProfile, Venue, Concert, SetOrder, YoutubeLink
+from .models import Artist, ArtistLinkingInfo, CustomText, ListenLink, MusicBrainzArtist, UserProfile, Venue, Concert, SetOrder, YoutubeLink, WeeklySendRun
 
 class SetOrderInline(admin.TabularInline):
     model = SetOrder
@@ -44,4 +44,5 @@ admin.site.register(Venue, VenueAdmin)
 admin.site.register(MusicBrainzArtist, MusicBrainzArtistAdmin)
 admin.site.register(ArtistLinkingInfo)
 admin.site.register(CustomText)
+admin.site.register(WeeklySendRun)
 # Register your models here.
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FindshowsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'findshows'
+
+    def ready(self):
+        from findshows import signals # Connects signal receivers
@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import os
+import shutil
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+# Times a download is resumed after a network error before giving up
+DOWNLOAD_RETRIES = 5
+
+
+class ChecksumError(Exception):
+    pass
+
+
+def published_sha256(sums_url, filename):
+    """
+    The SHA-256 listed for filename in a checksum file like SHA256SUMS (lines of
+    "<hash> <filename>", or just the hash if it's for a single file), or None if
+    there isn't one.
+    """
+    response = requests.get(sums_url, timeout=60)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    for line in response.text.splitlines():
+        parts = line.split()
+        if len(parts) == 1 or (len(parts) == 2 and os.path.basename(parts[1].lstrip('*')) == filename):
+            return parts[0].lower()
+    return None
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(DOWNLOAD_CHUNK_BYTES):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class DumpCache:
+    """
+    Files downloaded to directory/<dump id>/<filename>, so that an import can be
+    rerun without downloading them again. Downloads go to a .part file that's
+    resumed with an HTTP Range request after a network error, even by a later
+    run, and only get their real name once they're complete and match their
+    checksum. Dump ids must sort in date order, since only the newest `keep`
+    dumps are kept.
+    """
+    def __init__(self, directory, keep):
+        self.directory = directory
+        self.keep = keep
+
+
+    def path(self, dump_id, filename):
+        return os.path.join(self.directory, dump_id, filename)
+
+
+    def fetch(self, url, dump_id, filename, sha256=None):
+        """Returns the path of the downloaded file, downloading it first if it isn't cached."""
+        path = self.path(dump_id, filename)
+        if os.path.exists(path):
+            logger.info(f"Using cached {path}")
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial_path = f"{path}.part"
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            try:
+                self._download(url, partial_path)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                if attempt == DOWNLOAD_RETRIES:
+                    raise
+                logger.warning(f"Download of {url} interrupted, resuming: {str(e)}")
+                time.sleep(2 ** attempt)
+        if sha256 is not None and file_sha256(partial_path) != sha256:
+            os.remove(partial_path)
+            raise ChecksumError(f"{url} doesn't match its published SHA-256; deleted the download.")
+        os.replace(partial_path, path)
+        return path
+
+
+    def _download(self, url, partial_path):
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        headers = {'Range': f"bytes={offset}-"} if offset else {}
+        with requests.get(url, headers=headers, stream=True, timeout=60) as response:
+            if response.status_code == 416: # Range Not Satisfiable: we already have all of it
+                return
+            response.raise_for_status()
+            if response.status_code != 206: # The server ignored the range, so start over
+                offset = 0
+            expected_size = offset + int(response.headers['Content-Length']) if 'Content-Length' in response.headers else None
+            logger.info(f"Downloading {url}" + (f" from byte {offset}" if offset else ""))
+            with open(partial_path, 'ab' if offset else 'wb') as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+                    f.write(chunk)
+        size = os.path.getsize(partial_path)
+        if expected_size is not None and size != expected_size:
+            # e.g. the connection was closed early; fetch resumes from here
+            raise requests.ConnectionError(f"Only got {size} of {expected_size} bytes")
+
+
+    def prune(self):
+        """Deletes all but the newest `keep` dumps."""
+        if not os.path.isdir(self.directory):
+            return
+        dump_ids = sorted(entry.name for entry in os.scandir(self.directory) if entry.is_dir())
+        for dump_id in dump_ids[:max(len(dump_ids) - self.keep, 0)]:
+            logger.info(f"Deleting old dump {dump_id}")
+            shutil.rmtree(os.path.join(self.directory, dump_id))
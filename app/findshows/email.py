@@ -1,6 +1,14 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 import datetime
-from random import shuffle
+import hashlib
+import itertools
+import json
+import queue
+from random import Random
 import logging
+import threading
+import time
 from smtplib import SMTPException
 from django.utils import timezone
 from django.utils.safestring import mark_safe
@@ -9,17 +17,27 @@ import nh3
 
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
 from django.contrib.auth import get_user_model
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.tasks import task, default_task_backend
 
-from findshows.models import Artist, ArtistLinkingInfo, ArtistVerificationStatus, Concert, Contact, CustomText, CustomTextTypes, EmailVerification, UserProfile, Venue
+from findshows import mjml_layouts, mod_digest
+from findshows.models import ArtistLinkingInfo, Concert, CustomText, CustomTextTypes, EmailVerification, UserProfile, WeeklySendDelivery, WeeklySendRun
+from findshows.pipeline import PipelineStats, RateLimiter
+from findshows.scoring import ConcertRelevanceIndex
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
 
+# Renders of the weekly email kept for reuse by later recipients with the same signature
+RENDER_CACHE_SIZE = 1000
+# Stages of the weekly email pipeline, in the order they're logged
+REC_EMAIL_STAGES = ("Loaded", "Scored", "MJML", "Rendered", "Sent")
+
 PROTOCOL = "http" if settings.IS_DEV else "https"
 PORT = ":8000" if settings.IS_DEV else ""
 
@@ -144,19 +162,20 @@ be publically visible, and any artist invites have been sent.
 
 
 def daily_mod_email(date):
-    queries = {
-        "New artists": Artist.objects.filter(created_at=date),
-        "Actionable artist accounts": UserProfile.objects.filter(artist_verification_status=ArtistVerificationStatus.UNVERIFIED),
-        "New venues": Venue.objects.filter(created_at=date),
-        "Actionable venues": Venue.objects.filter(is_verified=False),
-        "New concerts": Concert.objects.filter(created_at=date),
-        "Contacts": Contact.objects.all(),
+    digest = mod_digest.get(date)
+    records_by_label = {
+        "New artists": digest['new_artists'],
+        "Actionable artist accounts": digest['unverified_user_profiles'],
+        "New venues": digest['new_venues'],
+        "Actionable venues": digest['unverified_venues'],
+        "New concerts": digest['new_concerts'],
+        "Contacts": digest['contacts'],
     }
-    if all(q.count()==0 for q in queries.values()):
+    if not any(records_by_label.values()):
         return True
 
-    record_strings = {l: ''.join(f"\n- {str(record)}" for record in q.all())
-                      for l, q in queries.items()}
+    record_strings = {l: ''.join(f"\n- {str(record)}" for record in records)
+                      for l, records in records_by_label.items()}
 
     url = local_url_to_email(reverse('findshows:mod_dashboard', query={'date': date.isoformat()}), "Click here to review")
     message_blocks = [f"There are new or actionable records from {str(date)}. {url}."]
@@ -197,111 +216,492 @@ def send_mass_html_mail(datatuples):
     The EMAIL_HOST_USER and EMAIL_HOST_PASSWORD settings are used to log in to the email service.
     """
     with get_connection() as connection:
-        sent = 0
-        for subject, text, html, from_email, recipient in datatuples:
+        return sum(_send_html_mails(datatuples, connection))
+
+
+def _html_message(datatuple, connection):
+    subject, text, html, from_email, recipient = datatuple
+    message = EmailMultiAlternatives(subject, text, from_email, recipient,
+                                     connection=connection)
+    message.attach_alternative(html, 'text/html')
+    return message
+
+
+def _send_html_mail(datatuple, connection):
+    try:
+        _html_message(datatuple, connection).send()
+        return 1
+    except SMTPException as e:
+        logger.warning(f"Email failure: {str(e)}")
+        return 0
+
+
+def _send_html_mails(datatuples, connection):
+    """Sends datatuples over connection and returns whether each one was sent."""
+    if hasattr(connection, 'send_messages_with_results'): # e.g. findshows.pooled_smtp
+        # The backend sends them concurrently and reports on each one
+        results = connection.send_messages_with_results(
+            [_html_message(datatuple, connection) for datatuple in datatuples])
+        for error in results:
+            if error is not None:
+                logger.warning(f"Email failure: {str(error)}")
+        return [error is None for error in results]
+    return [bool(_send_html_mail(datatuple, connection)) for datatuple in datatuples]
+
+
+class MailSenderPool:
+    """
+    Sends datatuples (as for send_mass_html_mail) from a number of threads, each
+    with its own connection to the email service, at no more than max_per_second
+    messages per second in total. Use as a context manager; exiting waits for
+    everything put() so far to be sent.
+
+    Each put() can be given a key, which pop_delivered() returns once that
+    message has been sent successfully.
+
+    With a backend that sends batches concurrently (findshows.pooled_smtp), each
+    thread hands it whatever is queued, up to the backend's pool_size at a time.
+    """
+    def __init__(self, threads, max_per_second, stats):
+        self.rate_limiter = RateLimiter(max_per_second)
+        self.stats = stats
+        self.messages = queue.Queue(maxsize=threads * 10)
+        self.delivered = queue.SimpleQueue()
+        self.threads = [threading.Thread(target=self._send_messages, daemon=True)
+                        for _ in range(threads)]
+
+
+    def __enter__(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+
+    def __exit__(self, *exc_info):
+        for _ in self.threads:
+            self.messages.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+    def put(self, datatuple, key=None):
+        self.messages.put((datatuple, key))
+
+
+    def pop_delivered(self):
+        """Returns the keys of messages sent since the last call."""
+        keys = []
+        while not self.delivered.empty():
+            keys.append(self.delivered.get())
+        return keys
+
+
+    def _send_messages(self):
+        connection = get_connection()
+        try:
+            connection.open()
+        except (SMTPException, OSError) as e:
+            # send() retries the connection for each message, so failures still get logged
+            logger.warning(f"Email failure: couldn't open connection: {str(e)}")
+        batch_size = getattr(connection, 'pool_size', 1)
+        try:
+            while batch := self._next_batch(batch_size):
+                start = time.monotonic()
+                try:
+                    sent = _send_html_mails([datatuple for datatuple, _ in batch], connection)
+                except Exception:
+                    # Keep draining the queue, or the producer would block forever
+                    logger.exception("Email failure")
+                    sent = [False] * len(batch)
+                self.stats.add(sum(sent), time.monotonic() - start)
+                for (_, key), was_sent in zip(batch, sent):
+                    if was_sent and key is not None:
+                        self.delivered.put(key)
+        finally:
+            connection.close()
+
+
+    def _next_batch(self, batch_size):
+        """
+        Waits for the next message, then adds whatever else is already queued, up
+        to batch_size. Returns an empty list once put() is finished with.
+        """
+        batch = []
+        while len(batch) < batch_size:
             try:
-                message = EmailMultiAlternatives(subject, text, from_email, recipient,
-                                                 connection=connection)
-                message.attach_alternative(html, 'text/html')
-                message.send()
-                sent += 1
-            except SMTPException as e:
-                logger.warning(f"Email failure: {str(e)}")
-    return sent
+                message = self.messages.get(block=not batch)
+            except queue.Empty:
+                break
+            if message is None:
+                # Leave it for the next call, so that this thread stops after sending the batch
+                self.messages.put(None)
+                break
+            self.rate_limiter.wait()
+            batch.append(message)
+        return batch
+
 
+def _rec_email_subscribers():
+    return UserProfile.objects.filter(weekly_email=True, email_is_verified=True)
 
-def _load_general_recommendation_data():
+
+def _undelivered(user_profiles, run):
+    return user_profiles.filter(~Exists(WeeklySendDelivery.objects.filter(run=run, user_profile=OuterRef('pk'))))
+
+
+def _rec_email_concerts(date, concert_pks=None):
+    """
+    Querysets of the concerts to recommend and the concerts to announce in the
+    email sent on date. If concert_pks (a pair of lists of pks, one for each) is
+    given, they're limited to those, so that every shard of a run sends the
+    concerts it started with.
+    """
+    week_later = date + datetime.timedelta(6)
+    concerts = Concert.publically_visible()
+    next_week_concerts = concerts.filter(date__gte=date, date__lte=week_later)
+    unannounced_concerts = concerts.filter(date__gt=week_later, announced=None)
+    if concert_pks is not None:
+        next_week_concerts = next_week_concerts.filter(pk__in=concert_pks[0])
+        unannounced_concerts = unannounced_concerts.filter(pk__in=concert_pks[1])
+    return next_week_concerts, unannounced_concerts
+
+
+def _load_general_recommendation_data(date=None, concert_pks=None):
     subject = CustomText.get_text(CustomTextTypes.WEEKLY_EMAIL_SUBJECT)
     email_header = CustomText.get_text(CustomTextTypes.WEEKLY_EMAIL_HEADER)
 
-    user_profiles = UserProfile.objects.filter(
-        weekly_email=True, email_is_verified=True).select_related(
-            'user').prefetch_related('favorite_musicbrainz_artists', 'followed_artists').only(
+    user_profiles = _rec_email_subscribers().select_related(
+            'user').prefetch_related('favorite_musicbrainz_artists').only(
                 'preferred_concert_tags',
                 'user', 'user__email',
                 'favorite_musicbrainz_artists', 'favorite_musicbrainz_artists__mbid',
-                'followed_artists',
-            )
-    today = datetime.date.today()
-    week_later = today + datetime.timedelta(6)
-    search_params = {'date': today,
-                      'end_date': week_later,
+            ) # followed artists are loaded by _load_followed_artist_ids
+    date = date or datetime.date.today()
+    search_params = {'date': date,
+                      'end_date': date + datetime.timedelta(6),
                       'is_date_range': True}
-    concerts = Concert.publically_visible().select_related('venue').prefetch_related('artists__similar_musicbrainz_artists')
-    next_week_concerts = tuple(concerts.filter(date__gte=today, date__lte=week_later))
-    unannounced_concerts = tuple(concerts.filter(date__gt=week_later, announced=None))
-
-    return subject, user_profiles, search_params, email_header, next_week_concerts, unannounced_concerts
+    next_week_concerts, unannounced_concerts = _rec_email_concerts(date, concert_pks)
+    next_week_concerts = tuple(next_week_concerts.with_card_data())
+    unannounced_concerts = tuple(unannounced_concerts.with_card_data())
+    # Only the columns for mbids that some subscriber is going to be scored against
+    subscriber_mbids = UserProfile.favorite_musicbrainz_artists.through.objects.filter(
+        userprofile__weekly_email=True, userprofile__email_is_verified=True).values('musicbrainzartist_id')
+    start = time.monotonic()
+    relevance_index = ConcertRelevanceIndex(next_week_concerts, subscriber_mbids)
+    logger.info(f"Built relevance index of {len(relevance_index)} (concert, mbid) scores for "
+                f"{len(next_week_concerts)} concerts and {len(relevance_index.columns)} mbids in {time.monotonic() - start:.2f}s")
+
+    return subject, user_profiles, search_params, email_header, next_week_concerts, unannounced_concerts, relevance_index
+
+
+def _load_followed_artist_ids(user_profiles):
+    """Sets followed_artist_ids on each of user_profiles, in a single query."""
+    followed_artist_ids = {user_profile.pk: [] for user_profile in user_profiles}
+    for user_profile_id, artist_id in UserProfile.followed_artists.through.objects.filter(
+            userprofile_id__in=followed_artist_ids).values_list('userprofile_id', 'artist_id'):
+        followed_artist_ids[user_profile_id].append(artist_id)
+    for user_profile in user_profiles:
+        user_profile.followed_artist_ids = followed_artist_ids[user_profile.pk]
+
+
+def _concerts_by_artist(concerts):
+    """Inverted index of artist pk to the pks of the concerts with that artist on the bill."""
+    index = {}
+    for c in concerts:
+        for artist in c.sorted_artists:
+            index.setdefault(artist.pk, set()).add(c.pk)
+    return index
 
 
-def _get_concerts_for_email(user_profile, search_params, next_week_concerts, unannounced_concerts):
-    followed_artists = set(user_profile.followed_artists.all())
+def _get_concerts_for_email(user_profile, search_params, next_week_concerts, unannounced_concerts, relevance_index, concerts_by_artist, seed):
+    followed_concert_ids = set().union(*(concerts_by_artist.get(artist_id, ())
+                                         for artist_id in user_profile.followed_artist_ids))
     followed_artist_concerts, not_followed_artist_concerts = [], []
     for c in next_week_concerts:
-        if followed_artists.intersection(c.artists.all()):
+        if c.pk in followed_concert_ids:
             followed_artist_concerts.append(c)
         else:
             not_followed_artist_concerts.append(c)
-    concerts_to_announce = [c for c in unannounced_concerts
-                            if followed_artists.intersection(c.artists.all())]
+    concerts_to_announce = [c for c in unannounced_concerts if c.pk in followed_concert_ids]
 
     tag_filtered_concerts = [c for c in not_followed_artist_concerts
                              if search_params['concert_tags'].intersection(c.tags)
                              ] if search_params['concert_tags'] else list(not_followed_artist_concerts)
 
-    scored_concerts = ((c.relevance_score(search_params['musicbrainz_artists']), c) for c in tag_filtered_concerts)
+    scores = relevance_index.scores(search_params['musicbrainz_artists'])
+    scored_concerts = ((scores.get(c.pk, 0), c) for c in tag_filtered_concerts)
     key_func = lambda s_c: (s_c[0], s_c[1].pk)
     rec_concerts = [s_c[1] for s_c in sorted((s_c for s_c in scored_concerts if s_c[0] != 0), reverse=True, key=key_func)][:settings.CONCERT_RECS_PER_EMAIL]
 
     random_concerts = tag_filtered_concerts or not_followed_artist_concerts
-    shuffle(random_concerts)
+    Random(seed).shuffle(random_concerts)
     random_concerts = random_concerts[:settings.CONCERT_RECS_PER_EMAIL]
 
     return followed_artist_concerts, rec_concerts, random_concerts, concerts_to_announce
 
 
-def _one_rec_email(user_profile, search_params, subject, email_header, next_week_concerts, unannounced_concerts):
+def rec_email_signature(user_profile):
+    """
+    Hash of everything _one_rec_email uses from a user profile other than the
+    recipient address, so that users with the same signature get the same email.
+    """
+    inputs = [
+        sorted(user_profile.followed_artist_ids),
+        sorted(mb_artist.mbid for mb_artist in user_profile.favorite_musicbrainz_artists.all()),
+        sorted(user_profile.preferred_concert_tags),
+    ]
+    return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
+
+def render_email_layout(template_name, layout_key, build_context, precompiled=True, stats=None):
+    """
+    Renders an email through its precompiled MJML layout (see mjml_layouts.render),
+    or compiles it from scratch if precompiled is False. Time spent compiling
+    MJML is added to stats["MJML"] if stats (a PipelineStats) is given.
+    """
+    def compile_mjml(template_name, context):
+        start = time.monotonic()
+        html = render_email_to_string(template_name, context)
+        if stats is not None:
+            stats["MJML"].add(1, time.monotonic() - start)
+        return html
+
+    if not precompiled:
+        return compile_mjml(template_name, build_context(mjml_layouts.Placeholders(tokens=False)))
+    return mjml_layouts.render(template_name, layout_key, build_context, compile_mjml)
+
+
+def _poster(concert, placeholders):
+    text = f"{concert.display_str()} | {concert.description}" if concert.description else concert.display_str()
+    return {
+        'alt': placeholders(str(concert)),
+        'src': placeholders(local_url_to_email(concert.poster_small.url)),
+        'href': placeholders(local_url_to_email(reverse('findshows:view_concert', args=(concert.pk,)))),
+        'text': placeholders(text),
+    }
+
+
+def _one_rec_email(user_profile, search_params, subject, email_header, email_header_html, next_week_concerts, unannounced_concerts, relevance_index, concerts_by_artist, signature, precompiled=True, stats=None):
     search_params = search_params.copy()
     search_params['musicbrainz_artists'] = [mb_artist.mbid
                                             for mb_artist in user_profile.favorite_musicbrainz_artists.all()]
     search_params['concert_tags'] = set(user_profile.preferred_concert_tags)
     search_url = local_url_to_email(reverse('findshows:home', query=search_params))
 
-    followed_artist_concerts, rec_concerts, random_concerts, concerts_to_announce = _get_concerts_for_email(user_profile, search_params, next_week_concerts, unannounced_concerts)
-
-    html_message = render_email_to_string("findshows/emails/rec_email.html", {
-        'followed_artist_concerts': followed_artist_concerts,
-        'concerts_to_announce': concerts_to_announce,
-        'rec_concerts': rec_concerts or random_concerts,
-        'search_url': search_url,
-        'email_header': mark_safe(nh3.clean(markdown(email_header))),
-        'has_recs': len(rec_concerts) > 0,
-    })
+    # Seeded so that everybody with this signature gets the same random concerts
+    seed = f"{signature}{search_params['date']}"
+    start = time.monotonic()
+    followed_artist_concerts, rec_concerts, random_concerts, concerts_to_announce = _get_concerts_for_email(user_profile, search_params, next_week_concerts, unannounced_concerts, relevance_index, concerts_by_artist, seed)
+    if stats is not None:
+        stats["Scored"].add(1, time.monotonic() - start)
+
+    rec_concerts_or_random = rec_concerts or random_concerts
+    def build_context(placeholders):
+        return {
+            'followed_artist_posters': [_poster(c, placeholders) for c in followed_artist_concerts],
+            'posters_to_announce': [_poster(c, placeholders) for c in concerts_to_announce],
+            'rec_posters': [_poster(c, placeholders) for c in rec_concerts_or_random],
+            'search_url': placeholders(search_url),
+            'email_header': placeholders(email_header_html),
+            'has_recs': len(rec_concerts) > 0,
+        }
+    layout_key = f"{len(followed_artist_concerts)}-{len(concerts_to_announce)}-{len(rec_concerts_or_random)}-{len(rec_concerts) > 0}"
+    html_message = render_email_layout("findshows/emails/rec_email.html", layout_key, build_context, precompiled, stats)
     text_message = f'{email_header}\n\nGo to {search_url} to see your weekly concert recommendations.'
 
     # datatuple expected by send_mass_html_mail
     return (subject, text_message, html_message, None, (user_profile.user.email,))
 
 
-def _update_share_date(concerts, field):
-    today = datetime.date.today()
+def _update_share_date(concerts, field, date):
     for c in concerts:
-        setattr(c, field, today)
+        setattr(c, field, date)
     Concert.objects.bulk_update(concerts, [field], 100)
 
 
+def _record_deliveries(run, user_profile_ids):
+    if user_profile_ids:
+        WeeklySendDelivery.objects.bulk_create((WeeklySendDelivery(run=run, user_profile_id=pk)
+                                                for pk in user_profile_ids),
+                                               ignore_conflicts=True)
+
+
+def _finish_run(run, next_week_concerts, unannounced_concerts):
+    """Marks the run finished and the concerts announced/shared, all at once and only once."""
+    with transaction.atomic():
+        if WeeklySendRun.objects.filter(pk=run.pk, finished_at=None).update(finished_at=timezone.now()):
+            _update_share_date(unannounced_concerts, 'announced', run.date)
+            _update_share_date(next_week_concerts, 'shared', run.date)
+
+
+def _render_rec_email(stats, user_profile, *args):
+    start = time.monotonic()
+    datatuple = _one_rec_email(user_profile, *args, stats=stats)
+    stats["Rendered"].add(1, time.monotonic() - start)
+    return datatuple
+
+
+def _send_rec_emails(run, user_profiles, subject, search_params, email_header, next_week_concerts, unannounced_concerts, relevance_index, stats=None):
+    """
+    Sends the weekly recommendation email to user_profiles as a pipeline: this
+    thread streams them from the database a chunk at a time, a pool of worker
+    threads scores and renders each one (mostly waiting on the MJML server), and a
+    MailSenderPool sends them. Everything the workers need is loaded up front,
+    so only this thread touches the database. Users with the same
+    rec_email_signature share one render, with only the recipient swapped in.
+
+    Deliveries are recorded against the run after every chunk, and anybody
+    already delivered to is skipped. Returns the number sent. The time spent in
+    each stage is logged and, if given, added to stats (a PipelineStats).
+    """
+    user_profiles = _undelivered(user_profiles, run)
+
+    chunk_size = settings.WEEKLY_EMAIL_CHUNK_SIZE
+    email_header_html = mark_safe(nh3.clean(markdown(email_header)))
+    renders = OrderedDict() # {signature: future}, least recently used first
+    concerts_by_artist = _concerts_by_artist(next_week_concerts + unannounced_concerts)
+    stats = stats if stats is not None else PipelineStats(*REC_EMAIL_STAGES)
+    load_stats, render_stats, send_stats = stats["Loaded"], stats["Rendered"], stats["Sent"]
+    sender_pool = MailSenderPool(settings.WEEKLY_EMAIL_SENDER_THREADS, settings.WEEKLY_EMAIL_MAX_PER_SECOND, send_stats)
+    try:
+        with ThreadPoolExecutor(max_workers=settings.WEEKLY_EMAIL_RENDER_WORKERS) as render_pool, sender_pool:
+
+            def hand_off(futures):
+                for future, user_profile in futures:
+                    datatuple = future.result()
+                    sender_pool.put((*datatuple[:4], (user_profile.user.email,)), user_profile.pk)
+
+            def render(user_profile):
+                signature = rec_email_signature(user_profile)
+                if signature in renders:
+                    renders.move_to_end(signature)
+                else:
+                    renders[signature] = render_pool.submit(
+                        _render_rec_email, stats, user_profile, search_params, subject, email_header,
+                        email_header_html, next_week_concerts, unannounced_concerts, relevance_index,
+                        concerts_by_artist, signature)
+                    if len(renders) > RENDER_CACHE_SIZE:
+                        renders.popitem(last=False)
+                return renders[signature]
+
+            # The previous chunk renders while the next one loads
+            rendering = []
+            user_profile_chunks = itertools.batched(user_profiles.iterator(chunk_size=chunk_size), chunk_size)
+            while True:
+                start = time.monotonic()
+                chunk = next(user_profile_chunks, None)
+                if chunk is not None:
+                    _load_followed_artist_ids(chunk)
+                load_stats.add(len(chunk or ()), time.monotonic() - start)
+                if chunk is None:
+                    break
+                futures = [(render(user_profile), user_profile) for user_profile in chunk]
+                hand_off(rendering)
+                rendering = futures
+                _record_deliveries(run, sender_pool.pop_delivered())
+                logger.info(f"Weekly email progress: loaded {load_stats.count}, rendered {render_stats.count}, sent {send_stats.count}")
+            hand_off(rendering)
+    finally:
+        # Anything that did get sent is recorded, even if rendering failed partway
+        _record_deliveries(run, sender_pool.pop_delivered())
+
+    for stage in stats:
+        logger.info(stage.summary())
+    logger.info(f"Rendered {render_stats.count} distinct emails for {load_stats.count} recipients")
+    return send_stats.count
+
+
 def send_rec_email():
-    subject, user_profiles, search_params, email_header, next_week_concerts, unannounced_concerts = _load_general_recommendation_data()
+    """
+    Sends the weekly recommendation email to every subscriber from this
+    process (see _send_rec_emails), checkpointing to today's WeeklySendRun so
+    that an interrupted send can just be started again. The concerts'
+    announced/shared dates are only updated once every subscriber has been
+    sent to, so anybody whose send failed gets it when the send is rerun.
+    """
+    subject, user_profiles, search_params, email_header, next_week_concerts, unannounced_concerts, relevance_index = _load_general_recommendation_data()
     if not (next_week_concerts or unannounced_concerts):
-        logger.info(f"There are no concerts listed this week--not sending recommendation emails.")
+        logger.info("There are no concerts listed this week--not sending recommendation emails.")
         return None
 
-    sent = send_mass_html_mail(_one_rec_email(user_profile, search_params, subject, email_header, next_week_concerts, unannounced_concerts)
-                               for user_profile in user_profiles.iterator(chunk_size=1000))
-
-    if sent:
-        _update_share_date(unannounced_concerts, 'announced')
-        _update_share_date(next_week_concerts, 'shared')
+    run, created = WeeklySendRun.objects.get_or_create(date=search_params['date'])
+    if run.finished_at:
+        logger.info(f"The recommendation email was already sent at {run.finished_at}--not sending again.")
+        return 0
+    if not created:
+        logger.info(f"Resuming the recommendation email started at {run.created_at}")
 
+    sent = _send_rec_emails(run, user_profiles, subject, search_params, email_header, next_week_concerts, unannounced_concerts, relevance_index)
     logger.info(f"Sent {sent} recommendation emails")
+    unsent = _undelivered(_rec_email_subscribers(), run).count()
+    if unsent:
+        logger.warning(f"{unsent} recommendation emails couldn't be sent--run send_weekly_recs again to retry them.")
+    else:
+        _finish_run(run, next_week_concerts, unannounced_concerts)
+
     return sent
+
+
+def enqueue_rec_email_shards():
+    """
+    Sends the weekly recommendation email as send_rec_email_shard tasks of
+    WEEKLY_EMAIL_SHARD_SIZE subscribers each on the emails queue, so that any
+    number of workers can send it in parallel. Every shard sends the concerts
+    listed when this is called, and the last shard to finish, whether or not it
+    succeeded, enqueues finish_rec_email_run. Like send_rec_email, rerunning it only enqueues the
+    subscribers that haven't been sent to yet, but it shouldn't be rerun while
+    the previous shards are still going. Returns the number of shards.
+    """
+    today = datetime.date.today()
+    next_week_concerts, unannounced_concerts = _rec_email_concerts(today)
+    concert_pks = (list(next_week_concerts.values_list('pk', flat=True)),
+                   list(unannounced_concerts.values_list('pk', flat=True)))
+    if not any(concert_pks):
+        logger.info("There are no concerts listed this week--not sending recommendation emails.")
+        return None
+
+    run, _ = WeeklySendRun.objects.get_or_create(date=today)
+    if run.finished_at:
+        logger.info(f"The recommendation email was already sent at {run.finished_at}--not sending again.")
+        return 0
+
+    user_profile_ids = list(_rec_email_subscribers().exclude(weeklysenddelivery__run=run).order_by('pk').values_list('pk', flat=True))
+    shards = list(itertools.batched(user_profile_ids, settings.WEEKLY_EMAIL_SHARD_SIZE))
+    run.recipient_count = run.deliveries.count() + len(user_profile_ids)
+    run.shard_count = len(shards)
+    run.shards_finished = 0
+    run.save(update_fields=['recipient_count', 'shard_count', 'shards_finished'])
+
+    logger.info(f"Enqueueing {len(shards)} shards of the recommendation email for {len(user_profile_ids)} recipients")
+    for shard in shards:
+        send_rec_email_shard.enqueue(run.pk, list(shard), concert_pks)
+    if not shards:
+        finish_rec_email_run.enqueue(run.pk, concert_pks)
+    return len(shards)
+
+
+@task(queue_name="emails")
+def send_rec_email_shard(run_pk, user_profile_ids, concert_pks):
+    run = WeeklySendRun.objects.get(pk=run_pk)
+    try:
+        subject, user_profiles, search_params, email_header, next_week_concerts, unannounced_concerts, relevance_index = _load_general_recommendation_data(run.date, concert_pks)
+        return _send_rec_emails(run, user_profiles.filter(pk__in=user_profile_ids), subject, search_params, email_header,
+                                next_week_concerts, unannounced_concerts, relevance_index)
+    finally:
+        # Counted even if it failed, so that finish_rec_email_run still reports on the run
+        WeeklySendRun.objects.filter(pk=run_pk).update(shards_finished=F('shards_finished') + 1)
+        run.refresh_from_db(fields=['shards_finished', 'shard_count'])
+        if run.shards_finished >= run.shard_count:
+            finish_rec_email_run.enqueue(run_pk, concert_pks)
+
+
+@task(queue_name="emails")
+def finish_rec_email_run(run_pk, concert_pks):
+    run = WeeklySendRun.objects.get(pk=run_pk)
+    unsent = _undelivered(_rec_email_subscribers(), run).count()
+    if unsent:
+        logger.error(f"{unsent} recommendation emails couldn't be sent--run send_weekly_recs --sharded again to retry them.")
+        return
+    next_week_concerts, unannounced_concerts = _rec_email_concerts(run.date, concert_pks)
+    _finish_run(run, tuple(next_week_concerts), tuple(unannounced_concerts))
+    logger.info(f"Finished sending the recommendation email to {run.deliveries.count()} recipients")
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.safestring import mark_safe
+from markdown import markdown
+import nh3
+
+from findshows.email import _concerts_by_artist, _load_followed_artist_ids, _load_general_recommendation_data, _one_rec_email, rec_email_signature
+
+
+class Command(BaseCommand):
+    help = """Times rendering this week's recommendation email for some of the
+    subscribers, both compiling every email with the MJML server and using
+    precompiled layouts. Doesn't send anything."""
+
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=100,
+                            help="Number of subscribers to render emails for.")
+
+
+    def handle(self, *args, **options):
+        subject, user_profiles, search_params, email_header, next_week_concerts, unannounced_concerts, relevance_index = _load_general_recommendation_data()
+        if not (next_week_concerts or unannounced_concerts):
+            raise CommandError("There are no concerts listed this week to render.")
+        user_profiles = list(user_profiles[:options['count']])
+        if not user_profiles:
+            raise CommandError("There are no subscribers to render emails for.")
+        _load_followed_artist_ids(user_profiles)
+        concerts_by_artist = _concerts_by_artist(next_week_concerts + unannounced_concerts)
+        email_header_html = mark_safe(nh3.clean(markdown(email_header)))
+
+        def render_all(precompiled):
+            start = time.monotonic()
+            for user_profile in user_profiles:
+                _one_rec_email(user_profile, search_params, subject, email_header, email_header_html, next_week_concerts,
+                               unannounced_concerts, relevance_index, concerts_by_artist, rec_email_signature(user_profile),
+                               precompiled)
+            return time.monotonic() - start
+
+        mjml_seconds = render_all(precompiled=False)
+        # The first pass includes compiling any layouts that weren't already cached
+        first_pass_seconds = render_all(precompiled=True)
+        precompiled_seconds = render_all(precompiled=True)
+
+        count = len(user_profiles)
+        for label, seconds in (("MJML server", mjml_seconds),
+                               ("Precompiled, first pass", first_pass_seconds),
+                               ("Precompiled", precompiled_seconds)):
+            self.stdout.write(f"{label}: {seconds:.2f}s ({1000 * seconds / count:.1f}ms per email)")
+        self.stdout.write(self.style.SUCCESS(f"Precompiled layouts were {mjml_seconds / precompiled_seconds:.1f}x faster for {count} emails."))
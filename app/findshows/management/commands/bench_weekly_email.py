@@ -0,0 +1,215 @@
+import datetime
+import random
+import secrets
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from findshows.email import REC_EMAIL_STAGES, _load_general_recommendation_data, _send_rec_emails
+from findshows.models import Ages, Artist, ArtistRelevance, ArtistVerificationStatus, Concert, ConcertTags, MusicBrainzArtist, MusicBrainzSimilarity, SetOrder, User, UserProfile, Venue, WeeklySendRun
+from findshows.pipeline import PipelineStats
+from findshows.scoring import ConcertRelevanceIndex
+
+
+EMAIL_BACKENDS = {
+    'locmem': "django.core.mail.backends.locmem.EmailBackend",
+    'file': "django.core.mail.backends.filebased.EmailBackend",
+}
+
+
+class Command(BaseCommand):
+    help = """Benchmarks the weekly recommendation email. Generates synthetic
+    subscribers, artists, concerts and MusicBrainz similarity data (or uses the
+    database's own with --use-existing), runs the whole send pipeline against the
+    locmem or file email backend, and reports the time and peak memory of each
+    stage. It also times scoring a sample of subscribers both with the per-concert
+    Concert.relevance_score and with ConcertRelevanceIndex. Everything happens in a transaction that's rolled back at the end."""
+
+
+    def add_arguments(self, parser):
+        parser.add_argument("--use-existing", action='store_true',
+                            help="Send to the subscribers and concerts already in the database instead of generating them.")
+        parser.add_argument("--users", type=int, default=5000, help="Synthetic subscribers.")
+        parser.add_argument("--artists", type=int, default=500, help="Synthetic artists.")
+        parser.add_argument("--concerts", type=int, default=150, help="Synthetic concerts.")
+        parser.add_argument("--mb-artists", type=int, default=2000, help="Synthetic MusicBrainz artists.")
+        parser.add_argument("--venues", type=int, default=20, help="Synthetic venues.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data.")
+        parser.add_argument("--email-backend", choices=EMAIL_BACKENDS, default='locmem')
+        parser.add_argument("--max-per-second", type=float,
+                            help="Override WEEKLY_EMAIL_MAX_PER_SECOND, e.g. to measure everything but the sending cap.")
+        parser.add_argument("--score-sample", type=int, default=500,
+                            help="Subscribers to score both ways when comparing relevance_score with the index (0 to skip).")
+        parser.add_argument("--no-memory", action='store_true',
+                            help="Don't trace memory, which slows everything down.")
+
+
+    def measure(self, label, func):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.monotonic()
+        result = func()
+        seconds = time.monotonic() - start
+        line = f"{label}: {seconds:.2f}s"
+        if self.trace_memory:
+            line += f", peak memory {tracemalloc.get_traced_memory()[1] / 2**20:.1f}MB"
+        self.stdout.write(line)
+        return result, seconds
+
+
+    def handle(self, *args, **options):
+        self.trace_memory = not options['no_memory']
+        email_settings = {'EMAIL_BACKEND': EMAIL_BACKENDS[options['email_backend']]}
+        if options['email_backend'] == 'file':
+            email_settings['EMAIL_FILE_PATH'] = tempfile.mkdtemp()
+        if options['max_per_second']:
+            email_settings['WEEKLY_EMAIL_MAX_PER_SECOND'] = options['max_per_second']
+
+        if self.trace_memory:
+            tracemalloc.start()
+        mail.outbox = []
+        try:
+            with override_settings(**email_settings), transaction.atomic():
+                self.benchmark(options)
+                transaction.set_rollback(True)
+        finally:
+            mail.outbox = []
+            if self.trace_memory:
+                tracemalloc.stop()
+            if 'EMAIL_FILE_PATH' in email_settings:
+                shutil.rmtree(email_settings['EMAIL_FILE_PATH'])
+
+
+    def benchmark(self, options):
+        if not options['use_existing']:
+            prefix, _ = self.measure("Generating data", lambda: self.generate(random.Random(options['seed']), options))
+
+        data, _ = self.measure("Loading", _load_general_recommendation_data)
+        subject, user_profiles, search_params, email_header, next_week_concerts, unannounced_concerts, relevance_index = data
+        if not (next_week_concerts or unannounced_concerts):
+            raise CommandError("There are no concerts listed this week to recommend.")
+        if not options['use_existing']:
+            user_profiles = user_profiles.filter(user__email__startswith=prefix)
+
+        if options['score_sample']:
+            self.compare_scoring(list(user_profiles[:options['score_sample']]), next_week_concerts)
+
+        # A fresh run, so that nobody's skipped as already delivered
+        WeeklySendRun.objects.filter(date=search_params['date']).delete()
+        run = WeeklySendRun.objects.create(date=search_params['date'])
+        stats = PipelineStats(*REC_EMAIL_STAGES)
+        sent, seconds = self.measure("Send pipeline", lambda: _send_rec_emails(
+            run, user_profiles, subject, search_params, email_header, next_week_concerts,
+            unannounced_concerts, relevance_index, stats))
+
+        # The pipeline's stages run at the same time, so only the pipeline as a whole has a peak memory
+        for stage in stats:
+            per_item = f", {1000 * stage.busy_seconds / stage.count:.1f}ms each" if stage.count else ""
+            self.stdout.write(f"    {stage.name}: {stage.count} in {stage.busy_seconds:.2f}s busy{per_item}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {sent} emails in {seconds:.2f}s ({sent / seconds if seconds else 0:.1f} emails/s)."))
+
+
+    def compare_scoring(self, user_profiles, concerts):
+        """Times scoring every concert for each of user_profiles with relevance_score, then with the index."""
+        searches = [[mb_artist.mbid for mb_artist in user_profile.favorite_musicbrainz_artists.all()]
+                    for user_profile in user_profiles]
+        concert_pks = [concert.pk for concert in concerts]
+        self.stdout.write(f"Scoring {len(concert_pks)} concerts for {len(searches)} subscribers:")
+
+        def score_per_concert():
+            # relevance_score needs every similarity loaded
+            concerts = list(Concert.objects.filter(pk__in=concert_pks).with_card_data(searched_mbids=None))
+            return [[concert.relevance_score(mbids) for concert in concerts] for mbids in searches if mbids]
+
+        def score_with_index():
+            index = ConcertRelevanceIndex(concerts)
+            return [index.scores(mbids) for mbids in searches if mbids]
+
+        _, old_seconds = self.measure("    Per-concert relevance_score", score_per_concert)
+        _, new_seconds = self.measure("    ConcertRelevanceIndex", score_with_index)
+        if new_seconds:
+            self.stdout.write(f"    {old_seconds / new_seconds:.1f}x faster with the index")
+
+
+    def generate(self, rng, options):
+        """Creates the synthetic data and returns the prefix of the subscribers' emails."""
+        prefix = f"bench{secrets.token_hex(4)}"
+        now = timezone.now()
+        today = datetime.date.today()
+
+        creator = UserProfile.objects.create(
+            user=User.objects.create_user(f"{prefix}-creator@bench.invalid", create_profile=False),
+            artist_verification_status=ArtistVerificationStatus.VERIFIED)
+        venues = Venue.objects.bulk_create(
+            Venue(name=f"{prefix} venue {i}", ages=Ages.ALL_AGES, website="https://bench.invalid",
+                  is_verified=True, created_by=creator)
+            for i in range(options['venues']))
+
+        mbids = [f"{prefix}-{i}" for i in range(options['mb_artists'])]
+        MusicBrainzArtist.objects.bulk_create(
+            (MusicBrainzArtist(mbid=mbid, name=mbid, similar_artists_cache_datetime=now) for mbid in mbids),
+            batch_size=1000)
+        MusicBrainzSimilarity.objects.bulk_create(
+            (MusicBrainzSimilarity(source_id=mbid, target_mbid=target_mbid, score=rng.random())
+             for mbid in mbids
+             for target_mbid in rng.sample(mbids, min(20, len(mbids)))
+             if target_mbid != mbid),
+            batch_size=1000)
+
+        artists = Artist.objects.bulk_create(
+            Artist(name=f"{prefix} artist {i}", local=True, is_temp_artist=False, created_by=creator)
+            for i in range(options['artists']))
+        Artist.similar_musicbrainz_artists.through.objects.bulk_create(
+            (Artist.similar_musicbrainz_artists.through(artist_id=artist.pk, musicbrainzartist_id=mbid)
+             for artist in artists
+             for mbid in rng.sample(mbids, min(3, len(mbids)))),
+            batch_size=1000)
+        ArtistRelevance.rebuild(artist.pk for artist in artists)
+
+        concerts = Concert.objects.bulk_create(
+            Concert(poster=f"{prefix}-poster.jpg", poster_small=f"{prefix}-poster-small.jpg",
+                    # Mostly this week, with some further out to announce
+                    date=today + datetime.timedelta(rng.randrange(7) if rng.random() < .8 else rng.randrange(7, 60)),
+                    start_time=datetime.time(20), venue=rng.choice(venues), ticket_description="$10",
+                    tags=rng.sample(ConcertTags.values, rng.randint(1, 2)), created_by=creator)
+            for _ in range(options['concerts']))
+        SetOrder.objects.bulk_create(
+            (SetOrder(concert=concert, artist=artist, order_number=i)
+             for concert in concerts
+             for i, artist in enumerate(rng.sample(artists, min(rng.randint(1, 4), len(artists))))),
+            batch_size=1000)
+        Concert.objects.filter(pk__in=[concert.pk for concert in concerts]).update_is_public()
+
+        users = User.objects.bulk_create(
+            (User(email=f"{prefix}-{i}@bench.invalid", password=make_password(None)) for i in range(options['users'])),
+            batch_size=1000)
+        user_profiles = UserProfile.objects.bulk_create(
+            (UserProfile(user=user, weekly_email=True, email_is_verified=True,
+                         preferred_concert_tags=rng.sample(ConcertTags.values, 1) if rng.random() < .3 else [])
+             for user in users),
+            batch_size=1000)
+        # Favourites come from a smaller pool of popular artists, so they overlap like real ones do
+        popular_mbids = mbids[:max(1, len(mbids) // 10)]
+        UserProfile.favorite_musicbrainz_artists.through.objects.bulk_create(
+            (UserProfile.favorite_musicbrainz_artists.through(userprofile_id=user_profile.pk, musicbrainzartist_id=mbid)
+             for user_profile in user_profiles if rng.random() < .5
+             for mbid in rng.sample(popular_mbids, min(rng.randint(1, 5), len(popular_mbids)))),
+            batch_size=1000)
+        UserProfile.followed_artists.through.objects.bulk_create(
+            (UserProfile.followed_artists.through(userprofile_id=user_profile.pk, artist_id=artist.pk)
+             for user_profile in user_profiles if rng.random() < .3
+             for artist in rng.sample(artists, min(rng.randint(1, 5), len(artists)))),
+            batch_size=1000)
+
+        self.stdout.write(f"Generated {len(users)} subscribers, {len(artists)} artists, {len(concerts)} concerts "
+                          f"and {len(mbids)} MusicBrainz artists")
+        return prefix
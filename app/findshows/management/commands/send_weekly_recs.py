@@ -1,11 +1,19 @@
 from django.core.management.base import BaseCommand, CommandError
 
-from findshows.email import send_rec_email
+from findshows.email import enqueue_rec_email_shards, send_rec_email
 
 
 class Command(BaseCommand):
     help = "Sends the weekly rec email with subject/message specified in Custom Texts (set thru site admin)."
 
+    def add_arguments(self, parser):
+        parser.add_argument("--sharded", action='store_true',
+                            help="Enqueue the email as tasks on the emails queue for the task workers to send, instead of sending it from this process.")
+
     def handle(self, *args, **options):
-        if send_rec_email():
+        if options['sharded']:
+            shards = enqueue_rec_email_shards()
+            if shards is not None:
+                self.stdout.write(self.style.SUCCESS(f'Enqueued {shards} shards.'))
+        elif send_rec_email():
             self.stdout.write(self.style.SUCCESS('Delivered emails.'))
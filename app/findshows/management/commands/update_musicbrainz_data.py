@@ -1,94 +1,194 @@
-import json
+import glob
+import itertools
+import os
 import requests
 import tarfile
-import itertools
 import re
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db.models import Exists, OuterRef
 
-from findshows.models import MusicBrainzArtist
+from findshows import musicbrainz_dump
+from findshows.dump_cache import DumpCache, published_sha256
+from findshows.musicbrainz_loaders import LOADERS
+from findshows.models import Artist, MusicBrainzArtist, MusicBrainzImport, UserProfile
 
 BATCH_SIZE = 10000
 data_root_url = "https://data.metabrainz.org/pub/musicbrainz"
+ARTIST_DUMP_FILENAME = "artist.tar.xz"
+STATS_DUMP_PREFIX = "listenbrainz-statistics-dump-"
 
 class Command(BaseCommand):
-    help = "Download latest artist info (mbid + name) from MusicBrainz and store it in our database."
+    help = """Download latest artist info (mbid + name) from MusicBrainz and store it in our database.
+    Does nothing if the latest dump has already been imported, and otherwise only
+    writes artists that are new or have changed since the last import. The dumps are
+    downloaded to MUSICBRAINZ_DUMP_DIR first, so an interrupted download resumes
+    where it left off and a rerun doesn't download them again."""
+
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                            help="Processes parsing the artist dump (default: one per CPU).")
+        parser.add_argument("--loader", choices=LOADERS, default='orm',
+                            help="""How artists are saved: 'orm' upserts batches with bulk_create; 'copy'
+                            COPYs them into a staging table and merges only the changed rows (PostgreSQL).""")
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument("--since", metavar="DUMP_ID",
+                          help="Only import if the latest dump is newer than this one (default: the last one imported).")
+        mode.add_argument("--full", action='store_true',
+                          help="""Import even if the latest dump has already been imported, comparing every artist's
+                          name and disambiguation rather than trusting the stored hashes.""")
+        parser.add_argument("--prune", action='store_true',
+                            help="""Afterwards, delete artists below MIN_LISTENERS_TO_IMPORT_MB that no user or artist
+                            references.""")
+        parser.add_argument("--from-dir", metavar="DIR",
+                            help=f"""Import already downloaded dumps from DIR instead of downloading the latest ones. DIR
+                            is named after the artist dump's id and holds its {ARTIST_DUMP_FILENAME} and a
+                            {STATS_DUMP_PREFIX}*.tar.* archive, like the directories in MUSICBRAINZ_DUMP_DIR.""")
 
 
     def get_lb_stats_from_filestream(self, f):
-        listeners = {}  # {artist_mbid: # listeners}
-        for line in f:
-            data = json.loads(line)['data']
-            for datum in data:
-                artist_mbid = datum['artist_mbid']
-                if artist_mbid not in listeners:
-                    listeners[artist_mbid] = 0
-                listeners[artist_mbid] += 1
-        return listeners
-
-
-    def fetch_and_process_statistics_json(self):
+        """Returns an MbidSet of the artists with at least MIN_LISTENERS_TO_IMPORT_MB listeners."""
+        eligible_mbids = musicbrainz_dump.count_listeners(f, settings.MIN_LISTENERS_TO_IMPORT_MB)
+        self.stdout.write(f"{len(eligible_mbids)} artists have at least {settings.MIN_LISTENERS_TO_IMPORT_MB} listeners")
+        return eligible_mbids
+
+
+    def fetch(self, dump_cache, url, dump_id, sha256_url):
+        """Downloads url to dump_cache (or finds it there) and returns its path."""
+        filename = url.rsplit("/", 1)[1]
+        self.stdout.write(f"\nSource: {url}")
+        sha256 = published_sha256(sha256_url, filename)
+        if sha256 is None:
+            self.stdout.write(self.style.WARNING(f"No published SHA-256 for {filename}; only checking its size"))
+        return dump_cache.fetch(url, dump_id, filename, sha256)
+
+
+    def fetch_statistics_archive(self, dump_cache, dump_id):
         response = requests.get(f"{data_root_url}/listenbrainz/fullexport/")
         response.raise_for_status()
         re_match = max(re.finditer("listenbrainz-dump-[0-9]+-(([0-9]+)-[0-9]+)-full", response.text),
                         key=lambda m: m.group(2))
         # Really hoping this is relatively static
-        folder_name = f"listenbrainz-statistics-dump-{re_match.group(1)}"
-        stats_url = f"{data_root_url}/listenbrainz/fullexport/{re_match.group(0)}/{folder_name}.tar.zst"
-        self.stdout.write(f"\nSource: {stats_url}")
-
-
-        with requests.get(stats_url, stream=True) as response:
-            response.raise_for_status()
-            with tarfile.open(fileobj=response.raw, mode="r|*") as tar:
-                for member in tar:
-                    if member.isfile() and member.path == f"{folder_name}/lbdump/statistics/artists_all_time.jsonl":
-                        self.stdout.write(f"\nProcessing {member.path}")
-                        with tar.extractfile(member) as stats_jsonl_file:
-                            return self.get_lb_stats_from_filestream(stats_jsonl_file)
-
-
-    def mb_artist_from_line(self, line):
-        artist_json = json.loads(line)
-        return MusicBrainzArtist(mbid=artist_json['id'], name=artist_json['name'], disambiguation=artist_json['disambiguation'])
-
-
-    def save_mb_artists_from_filestream(self, f, listeners):
-        processed = 0
-        for mb_artists in itertools.batched((self.mb_artist_from_line(line) for line in f), BATCH_SIZE):
-            mb_artists = (a for a in mb_artists if a.mbid in listeners and listeners[a.mbid] >= settings.MIN_LISTENERS_TO_IMPORT_MB)
-            MusicBrainzArtist.objects.bulk_create(mb_artists,
-                                                  update_conflicts=True,
-                                                  update_fields=('name', 'disambiguation'),
-                                                  unique_fields=('mbid',))
-            processed += BATCH_SIZE
-            self.stdout.write(f"Processed: {processed}")
+        stats_url = f"{data_root_url}/listenbrainz/fullexport/{re_match.group(0)}/{STATS_DUMP_PREFIX}{re_match.group(1)}.tar.zst"
+        return self.fetch(dump_cache, stats_url, dump_id, f"{stats_url}.sha256")
+
+
+    def process_statistics_archive(self, path):
+        folder_name = os.path.basename(path).split(".tar")[0]
+        with tarfile.open(path, mode="r|*") as tar:
+            for member in tar:
+                if member.isfile() and member.path == f"{folder_name}/lbdump/statistics/artists_all_time.jsonl":
+                    self.stdout.write(f"\nProcessing {member.path}")
+                    with tar.extractfile(member) as stats_jsonl_file:
+                        return self.get_lb_stats_from_filestream(stats_jsonl_file)
+        raise CommandError(f"{path} has no {folder_name}/lbdump/statistics/artists_all_time.jsonl")
+
+
+    def save_mb_artists_from_filestream(self, f, eligible_mbids, workers, loader):
+        """
+        Parses the artist dump in worker processes (see
+        musicbrainz_dump.parse_artist_dump) and saves the eligible artists from
+        this process with loader (see musicbrainz_loaders), BATCH_SIZE at a time.
+        """
+        processed = loaded = 0
+        batch = []
+        with loader:
+            for lines, artists in musicbrainz_dump.parse_artist_dump(f, eligible_mbids, workers):
+                processed += lines
+                batch.extend(artists)
+                if len(batch) >= BATCH_SIZE:
+                    loader.load(batch)
+                    loaded += len(batch)
+                    batch = []
+                    self.stdout.write(f"Processed: {processed}, loaded: {loaded}")
+            loader.load(batch)
+            loaded += len(batch)
+            self.stdout.write(f"Processed: {processed}, loaded: {loaded}")
+            counts = loader.finish()
+        self.stdout.write("Artists " + ", ".join(f"{label}: {count}" for label, count in counts.items()))
+
+
+    def latest_artist_dump_id(self):
+        response = requests.get(f"{data_root_url}/data/json-dumps/LATEST")
+        response.raise_for_status()
+        return response.text.strip()
 
 
+    def fetch_artist_archive(self, dump_cache, dump_id):
+        dump_url = f"{data_root_url}/data/json-dumps/{dump_id}"
+        return self.fetch(dump_cache, f"{dump_url}/{ARTIST_DUMP_FILENAME}", dump_id, f"{dump_url}/SHA256SUMS")
 
-    def fetch_and_process_artist_json(self, listeners):
-        response = requests.get(f"{data_root_url}/data/json-dumps/LATEST")
-        latest_dirname = response.text.strip()
-        artist_dump_url = f"{data_root_url}/data/json-dumps/{latest_dirname}/artist.tar.xz"
-        self.stdout.write(f"\nSource: {artist_dump_url}")
 
-        with requests.get(artist_dump_url, stream=True) as response:
-            response.raise_for_status()
-            with tarfile.open(fileobj=response.raw, mode="r|*") as tar:
-                for member in tar:
-                    if member.isfile() and member.path == "mbdump/artist":
-                        with tar.extractfile(member) as artist_json_file:
-                            self.stdout.write(f"\nProcessing {member.path}")
-                            self.save_mb_artists_from_filestream(artist_json_file, listeners)
+    def process_artist_archive(self, path, eligible_mbids, workers, loader):
+        with tarfile.open(path, mode="r|*") as tar:
+            for member in tar:
+                if member.isfile() and member.path == "mbdump/artist":
+                    with tar.extractfile(member) as artist_json_file:
+                        self.stdout.write(f"\nProcessing {member.path}")
+                        self.save_mb_artists_from_filestream(artist_json_file, eligible_mbids, workers, loader)
+                        return
+        raise CommandError(f"{path} has no mbdump/artist")
+
+
+    def archives_in(self, directory):
+        """The (statistics, artist) archives in a directory laid out like the ones in MUSICBRAINZ_DUMP_DIR."""
+        stats_paths = sorted(path for path in glob.glob(os.path.join(directory, f"{STATS_DUMP_PREFIX}*.tar*"))
+                             if not path.endswith(".part"))
+        artist_path = os.path.join(directory, ARTIST_DUMP_FILENAME)
+        if not stats_paths or not os.path.isfile(artist_path):
+            raise CommandError(f"{directory} needs an {ARTIST_DUMP_FILENAME} and a {STATS_DUMP_PREFIX}*.tar.* archive")
+        return stats_paths[-1], artist_path
+
+
+    def prune(self, eligible_mbids):
+        """Deletes the artists that aren't eligible any more, unless a user or artist references them."""
+        batches = itertools.batched(MusicBrainzArtist.objects.values_list('mbid', flat=True).iterator(BATCH_SIZE), BATCH_SIZE)
+        stale_mbids = (mbid for batch in batches
+                       for mbid, is_eligible in zip(batch, eligible_mbids.contains(batch)) if not is_eligible)
+        pruned = 0
+        for mbids in itertools.batched(stale_mbids, BATCH_SIZE):
+            _, deleted = MusicBrainzArtist.objects.filter(mbid__in=mbids).exclude(
+                Exists(UserProfile.favorite_musicbrainz_artists.through.objects.filter(musicbrainzartist=OuterRef('pk')))
+            ).exclude(
+                Exists(Artist.similar_musicbrainz_artists.through.objects.filter(musicbrainzartist=OuterRef('pk')))
+            ).delete()
+            pruned += deleted.get(MusicBrainzArtist._meta.label, 0)
+        self.stdout.write(f"Pruned {pruned} artists below {settings.MIN_LISTENERS_TO_IMPORT_MB} listeners")
 
 
     def handle(self, *args, **options):
+        if options['from_dir']:
+            dump_id = os.path.basename(os.path.normpath(options['from_dir']))
+        else:
+            dump_id = self.latest_artist_dump_id()
+        since = options['since'] or MusicBrainzImport.last_dump_id()
+        if not options['full'] and since is not None and dump_id <= since:
+            self.stdout.write(self.style.SUCCESS(
+                f"\n\nThe artist dump, {dump_id}, is no newer than {since}. Use --full to import it anyway."))
+            return
+
+        dump_cache = DumpCache(settings.MUSICBRAINZ_DUMP_DIR, settings.MUSICBRAINZ_DUMPS_TO_KEEP)
+        if options['from_dir']:
+            stats_path, artist_path = self.archives_in(options['from_dir'])
+        else:
+            self.stdout.write("\n\nDownloading listen statistics")
+            stats_path = self.fetch_statistics_archive(dump_cache, dump_id)
+            self.stdout.write("\n\nDownloading artist data")
+            artist_path = self.fetch_artist_archive(dump_cache, dump_id)
+
         self.stdout.write("\n\nGetting listen statistics")
-        listeners = self.fetch_and_process_statistics_json()
+        eligible_mbids = self.process_statistics_archive(stats_path)
 
         self.stdout.write("\n\nGetting artist data")
-        self.fetch_and_process_artist_json(listeners)
+        loader = LOADERS[options['loader']](full=options['full'])
+        self.process_artist_archive(artist_path, eligible_mbids, options['workers'], loader)
+        if options['prune']:
+            self.prune(eligible_mbids)
+        MusicBrainzImport.objects.update_or_create(dump_id=dump_id)
+        if not options['from_dir']:
+            dump_cache.prune()
 
         self.stdout.write(self.style.SUCCESS("\n\nSuccessfully completed importing MusicBrainz artists."))
         self.stdout.write(f"\n{MusicBrainzArtist.objects.count()} MusicBrainz artists in database.\n")
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+
+from django.core.management.base import BaseCommand
+
+from findshows import musicbrainz
+from findshows.models import Artist, MusicBrainzArtist, UserProfile
+from findshows.pipeline import RateLimiter
+
+
+class Command(BaseCommand):
+    help = """Fetches ListenBrainz similarity data for every MusicBrainz artist
+    that's used on an artist or user profile and is stale or was never fetched,
+    so that searches and emails don't have to wait on the API."""
+
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action='store_true',
+                            help="Refresh every referenced artist, not just stale ones.")
+        parser.add_argument("--batch-size", type=int, default=musicbrainz.MAX_BATCH_SIZE,
+                            help="MBIDs per API request.")
+        parser.add_argument("--concurrency", type=int, default=2,
+                            help="Maximum number of API requests in flight.")
+        parser.add_argument("--rate", type=float, default=1,
+                            help="Maximum API requests per second.")
+
+
+    def referenced_mb_artists(self):
+        mbids = set(Artist.similar_musicbrainz_artists.through.objects.values_list('musicbrainzartist_id', flat=True))
+        mbids.update(UserProfile.favorite_musicbrainz_artists.through.objects.values_list('musicbrainzartist_id', flat=True))
+        return MusicBrainzArtist.objects.filter(mbid__in=mbids)
+
+
+    def handle(self, *args, **options):
+        mb_artists = {mba.mbid: mba for mba in self.referenced_mb_artists()
+                      if options['all']
+                      or mba.similar_artists_cache_datetime is None
+                      or mba.similar_artists_are_stale()}
+        batches = list(itertools.batched(mb_artists, min(options['batch_size'], musicbrainz.MAX_BATCH_SIZE)))
+        self.stdout.write(f"Refreshing {len(mb_artists)} artists in {len(batches)} requests")
+
+        rate_limiter = RateLimiter(options['rate'])
+        def fetch(batch):
+            rate_limiter.wait()
+            return batch, musicbrainz.get_similar_artists_batch(batch)
+
+        # Only the requests run in the pool; results are saved from this thread
+        refreshed = failed = 0
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for batch, results in executor.map(fetch, batches):
+                if results is None:
+                    failed += len(batch)
+                    continue
+                for mbid in batch:
+                    mb_artists[mbid].set_similar_artists(results[mbid])
+                refreshed += len(batch)
+                self.stdout.write(f"Refreshed: {refreshed}")
+
+        if failed:
+            self.stdout.write(self.style.WARNING(f"Failed to fetch {failed} artists; see the log for details."))
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {refreshed} artists."))
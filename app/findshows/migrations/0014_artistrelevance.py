@@ -0,0 +1,51 @@
+# Generated by Django 6.0.4 on 2026-10-18 10:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def scores_for_artist(mb_artists):
+    # Copy of ArtistRelevance.scores_for_artist as of this migration
+    if not mb_artists:
+        return {}
+    totals = {}
+    for mbid, similar_artists in mb_artists:
+        totals[mbid] = totals.get(mbid, 0) + 1
+        for similar_mbid, score in (similar_artists or {}).items():
+            if similar_mbid != mbid:
+                totals[similar_mbid] = totals.get(similar_mbid, 0) + score
+    return {mbid: total / len(mb_artists) for mbid, total in totals.items() if total}
+
+
+def fill_artist_relevance(apps, schema_editor):
+    Artist = apps.get_model('findshows', 'Artist')
+    ArtistRelevance = apps.get_model('findshows', 'ArtistRelevance')
+    for artist in Artist.objects.prefetch_related('similar_musicbrainz_artists'):
+        mb_artists = [(mba.mbid, mba.similar_artists) for mba in artist.similar_musicbrainz_artists.all()]
+        scores = scores_for_artist(mb_artists)
+        ArtistRelevance.objects.bulk_create(ArtistRelevance(artist=artist, mbid=mbid, score=score)
+                                            for mbid, score in scores.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('findshows', '0013_concert_shared'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArtistRelevance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mbid', models.CharField(max_length=40)),
+                ('score', models.FloatField()),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relevances', to='findshows.artist')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['mbid', 'artist'], name='artist_relevance_mbid')],
+                'unique_together': {('artist', 'mbid')},
+            },
+        ),
+        migrations.RunPython(fill_artist_relevance, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 6.0.4 on 2026-10-18 11:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_similarities(apps, schema_editor):
+    MusicBrainzArtist = apps.get_model('findshows', 'MusicBrainzArtist')
+    MusicBrainzSimilarity = apps.get_model('findshows', 'MusicBrainzSimilarity')
+    mb_artists = MusicBrainzArtist.objects.filter(similar_artists__isnull=False).values_list('mbid', 'similar_artists')
+    for mbid, similar_artists in mb_artists.iterator(chunk_size=1000):
+        MusicBrainzSimilarity.objects.bulk_create(
+            MusicBrainzSimilarity(source_id=mbid, target_mbid=target_mbid, score=score)
+            for target_mbid, score in similar_artists.items()
+            if target_mbid != mbid)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('findshows', '0014_artistrelevance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MusicBrainzSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_mbid', models.CharField(max_length=40)),
+                ('score', models.FloatField()),
+                ('source', models.ForeignKey(db_column='source_mbid', on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='findshows.musicbrainzartist')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['target_mbid', 'source'], name='mb_similarity_target')],
+                'unique_together': {('source', 'target_mbid')},
+            },
+        ),
+        migrations.RunPython(fill_similarities, reverse_code=migrations.RunPython.noop),
+    ]
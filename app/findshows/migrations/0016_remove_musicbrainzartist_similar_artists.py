@@ -0,0 +1,17 @@
+# Generated by Django 6.0.4 on 2026-10-18 11:03
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('findshows', '0015_musicbrainzsimilarity'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='musicbrainzartist',
+            name='similar_artists',
+        ),
+    ]
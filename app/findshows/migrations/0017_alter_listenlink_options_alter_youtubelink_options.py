@@ -0,0 +1,21 @@
+# Generated by Django 6.0.4 on 2026-10-18 12:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('findshows', '0016_remove_musicbrainzartist_similar_artists'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='listenlink',
+            options={'ordering': ('order',)},
+        ),
+        migrations.AlterModelOptions(
+            name='youtubelink',
+            options={'ordering': ('order',)},
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.0.4 on 2026-10-18 13:05
+
+from django.db import migrations, models
+from django.db.models import Q
+
+from findshows.models import ArtistVerificationStatus
+
+
+def fill_is_public(apps, schema_editor):
+    Concert = apps.get_model('findshows', 'Concert')
+    public = Concert.objects.exclude(
+        Q(artists__is_temp_artist=True) |
+        Q(venue__is_verified=False) |
+        Q(venue__declined_listing=True) |
+        Q(cancelled=True)
+    ).filter(created_by__artist_verification_status__in=(
+        ArtistVerificationStatus.VERIFIED,
+        ArtistVerificationStatus.INVITED
+    ))
+    Concert.objects.filter(pk__in=public.values('pk')).update(is_public=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('findshows', '0017_alter_listenlink_options_alter_youtubelink_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='concert',
+            name='is_public',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='concert',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['date'], name='concert_public_date'),
+        ),
+        migrations.RunPython(fill_is_public, reverse_code=migrations.RunPython.noop),
+    ]
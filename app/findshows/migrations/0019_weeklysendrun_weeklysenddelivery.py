@@ -0,0 +1,35 @@
+# Generated by Django 6.0.4 on 2026-10-18 14:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('findshows', '0018_concert_is_public'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklySendRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WeeklySendDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='findshows.weeklysendrun')),
+                ('user_profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='findshows.userprofile')),
+            ],
+            options={
+                'unique_together': {('run', 'user_profile')},
+            },
+        ),
+    ]
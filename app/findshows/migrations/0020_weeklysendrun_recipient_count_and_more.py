@@ -0,0 +1,28 @@
+# Generated by Django 6.0.4 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('findshows', '0019_weeklysendrun_weeklysenddelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weeklysendrun',
+            name='recipient_count',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='weeklysendrun',
+            name='shard_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='weeklysendrun',
+            name='shards_finished',
+            field=models.IntegerField(default=0),
+        ),
+    ]
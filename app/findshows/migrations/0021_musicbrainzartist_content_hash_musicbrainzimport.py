@@ -0,0 +1,26 @@
+# Generated by Django 6.0.4 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('findshows', '0020_weeklysendrun_recipient_count_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MusicBrainzImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dump_id', models.CharField(max_length=40, unique=True)),
+                ('imported_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='musicbrainzartist',
+            name='content_hash',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+    ]
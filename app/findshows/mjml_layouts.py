@@ -0,0 +1,104 @@
+"""
+Precompiled MJML layouts for emails.
+
+Compiling MJML means a round-trip to the mjml server, but most of the weekly
+email's MJML is the same from one recipient to the next: only the text, links
+and images change, while the structure (which sections there are and how many
+posters are in each) is shared by a handful of layouts. So the first email of
+each layout is rendered with a placeholder token in place of every varying
+value, and the compiled HTML is cached; every later email with that layout just
+swaps its own values in for the tokens, without talking to the mjml server.
+"""
+from functools import cache as memoize
+import hashlib
+from pathlib import Path
+import re
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.html import conditional_escape
+
+
+LAYOUT_CACHE_SECONDS = 7 * 24 * 60 * 60
+EMAIL_TEMPLATE_DIR = Path(__file__).parent / 'templates' / 'findshows' / 'emails'
+# Letters and digits only so that MJML passes it through untouched wherever it appears
+TOKEN_PATTERN = re.compile(r"mjmlph(\d+)x")
+
+# One lock per cache key, so that render workers needing the same new layout
+# compile it once between them rather than each racing to the mjml server
+_compile_locks = {}
+_compile_locks_lock = threading.Lock()
+
+
+class Placeholders:
+    """
+    Called on each varying value while building an email's context. Returns
+    either the value itself (when rendering normally) or a placeholder token
+    (when compiling a layout) and remembers the escaped value for substitute().
+    """
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.values = []
+
+
+    def __call__(self, value):
+        self.values.append(conditional_escape(value))
+        if self.tokens:
+            return f"mjmlph{len(self.values) - 1}x"
+        return value
+
+
+    def substitute(self, html):
+        return TOKEN_PATTERN.sub(lambda match: self.values[int(match[1])], html)
+
+
+@memoize
+def templates_version():
+    """Changes whenever anything that's baked into a compiled layout does."""
+    digest = hashlib.sha256()
+    for path in sorted(EMAIL_TEMPLATE_DIR.rglob('*.html')):
+        digest.update(path.read_bytes())
+    digest.update(f"{settings.SITE_TITLE}|{settings.HOST_NAME}|{settings.IS_DEV}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _cache_key(template_name, layout_key):
+    return f"mjml_layout:{templates_version()}:{template_name}:{layout_key}"
+
+
+def render(template_name, layout_key, build_context, render_fallback):
+    """
+    Renders template_name using the precompiled layout for layout_key, compiling
+    it first if need be. layout_key must capture everything that changes the
+    structure of the rendered MJML, and build_context(placeholders) must pass every
+    other varying value through placeholders(), in the same order each time.
+
+    Falls back to render_fallback(template_name, context), i.e. compiling this
+    one email, if the layout couldn't be precompiled.
+    """
+    key = _cache_key(template_name, layout_key)
+    compiled = cache.get(key, False) # None means it can't be precompiled
+    if compiled is False:
+        compiled = _compile(key, template_name, build_context, render_fallback)
+
+    if compiled is None:
+        return render_fallback(template_name, build_context(Placeholders(tokens=False)))
+    placeholders = Placeholders(tokens=True)
+    build_context(placeholders)
+    return placeholders.substitute(compiled)
+
+
+def _compile(key, template_name, build_context, render_fallback):
+    with _compile_locks_lock:
+        lock = _compile_locks.setdefault(key, threading.Lock())
+    with lock:
+        compiled = cache.get(key, False) # Another thread may have compiled it while we waited
+        if compiled is False:
+            placeholders = Placeholders(tokens=True)
+            html = render_fallback(template_name, build_context(placeholders))
+            # If MJML rewrote or dropped any token, the values can't be swapped in safely
+            found = {int(match[1]) for match in TOKEN_PATTERN.finditer(html)}
+            compiled = html if found == set(range(len(placeholders.values))) else None
+            cache.set(key, compiled, LAYOUT_CACHE_SECONDS)
+    return compiled
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from findshows import search_cache
+from findshows.models import Artist, ArtistVerificationStatus, Concert, Contact, UserProfile, Venue
+
+
+# Bumped by signals whenever a record in the digest might have changed, which
+# invalidates every date's cached digest at once.
+VERSION_KEY = "mod_digest_version"
+
+
+def build(date):
+    """
+    Loads every record moderators review for date, with everything the daily
+    mod email and the mod dashboard display, in a fixed number of queries.
+    """
+    return {
+        'new_artists': list(Artist.objects.filter(created_at=date).prefetch_related(
+            'artistlinkinginfo_set', 'managing_users__user')),
+        'unverified_user_profiles': list(UserProfile.objects.filter(
+            artist_verification_status=ArtistVerificationStatus.UNVERIFIED
+        ).select_related('user').prefetch_related('managed_artists')),
+        'new_venues': list(Venue.objects.filter(created_at=date)),
+        'unverified_venues': list(Venue.objects.filter(is_verified=False)),
+        'new_concerts': Concert.load_conflicts(Concert.objects.filter(created_at=date).with_card_data()),
+        'contacts': list(Contact.objects.all()),
+    }
+
+
+def get(date):
+    """The digest for date, from the cache if nothing has changed since it was built."""
+    key = f"mod_digest:{search_cache.get_version(VERSION_KEY)}:{date.isoformat()}"
+    digest = cache.get(key)
+    if digest is None:
+        digest = build(date)
+        cache.set(key, digest, settings.MOD_DIGEST_CACHE_SECONDS)
+    return digest
+
+
+def bump_version():
+    search_cache.bump_version(VERSION_KEY)
@@ -9,14 +9,17 @@ import secrets
 from PIL import Image
 import io
 
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import Case, Count, Exists, FloatField, OuterRef, Prefetch, Q, Subquery, Sum, Value, When
+from django.db.models.functions import MD5, Cast, Coalesce, Concat, NullIf
 from django.db.models.fields.files import ImageFieldFile
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.core.cache import cache
 from django.core.validators import EmailValidator, URLValidator
 from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
 from django.conf import settings
+from django.tasks import TaskResultStatus
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.safestring import mark_safe
@@ -167,8 +170,11 @@ class MusicBrainzArtist(models.Model):
     mbid = models.CharField(primary_key=True, max_length=40)
     name = models.CharField()
     disambiguation = models.CharField(null=True)
-    similar_artists = models.JSONField(editable=False, null=True)
+    # None until similar artists have been successfully fetched from ListenBrainz
     similar_artists_cache_datetime = models.DateTimeField(editable=False, null=True)
+    # musicbrainz_dump.content_hash of the name and disambiguation as last imported,
+    # so update_musicbrainz_data can skip artists that haven't changed
+    content_hash = models.BigIntegerField(editable=False, null=True)
 
 
     class Meta:
@@ -177,20 +183,59 @@ class MusicBrainzArtist(models.Model):
         ]
 
 
-    def get_similar_artists(self):
-        if self.similar_artists_cache_datetime is None or self.similar_artists is None:
-            needs_update = True
-        else:
-            needs_update = self.similar_artists_cache_datetime < now() - timedelta(settings.LISTENBRAINZ_SIMILAR_ARTIST_CACHE_DAYS)
+    def set_similar_artists(self, similar_artists):
+        """similar_artists is a dict of {mbid: similarity_score}, as returned by musicbrainz.get_similar_artists"""
+        with transaction.atomic():
+            self.similarities.all().delete()
+            MusicBrainzSimilarity.objects.bulk_create(
+                (MusicBrainzSimilarity(source=self, target_mbid=mbid, score=score)
+                 for mbid, score in similar_artists.items()
+                 if mbid != self.mbid),
+                batch_size=1000)
+            self.similar_artists_cache_datetime = now()
+            self.save() # after the similarities are written, since saving updates ArtistRelevance
+        if hasattr(self, '_prefetched_objects_cache'):
+            self._prefetched_objects_cache.pop('similarities', None)
+
+
+    def similar_artists_cache_days(self):
+        """
+        LISTENBRAINZ_SIMILAR_ARTIST_CACHE_DAYS, plus or minus up to
+        LISTENBRAINZ_SIMILAR_ARTIST_CACHE_JITTER_DAYS (fixed per artist) so that
+        artists fetched on the same day don't all expire on the same day.
+        """
+        fraction = int(hashlib.md5(self.mbid.encode()).hexdigest()[:8], 16) / 0xffffffff
+        jitter = settings.LISTENBRAINZ_SIMILAR_ARTIST_CACHE_JITTER_DAYS * (2 * fraction - 1)
+        return settings.LISTENBRAINZ_SIMILAR_ARTIST_CACHE_DAYS + jitter
+
+
+    def similar_artists_are_stale(self):
+        return self.similar_artists_cache_datetime < now() - timedelta(self.similar_artists_cache_days())
+
+
+    def enqueue_similar_artists_refresh(self):
+        """Refreshes similar artists in the background, unless a refresh is already queued."""
+        if not cache.add(musicbrainz.refresh_lock_key(self.mbid), True, musicbrainz.REFRESH_LOCK_SECONDS):
+            return
+        result = musicbrainz.refresh_similar_artists.enqueue(self.mbid)
+        if result.status == TaskResultStatus.SUCCESSFUL: # e.g. the immediate backend in dev
+            self.refresh_from_db(fields=['similar_artists_cache_datetime'])
+            if hasattr(self, '_prefetched_objects_cache'):
+                self._prefetched_objects_cache.pop('similarities', None)
+
 
-        if needs_update:
+    def get_similar_artists(self):
+        if self.similar_artists_cache_datetime is None:
+            # Nothing to serve in the meantime, so this has to wait on the API
             artists_from_api = musicbrainz.get_similar_artists(self.mbid)
-            if artists_from_api is not None:
-                self.similar_artists = artists_from_api
-                self.similar_artists_cache_datetime = now()
-                self.save()
+            if artists_from_api is None:
+                return None
+            self.set_similar_artists(artists_from_api)
+        elif self.similar_artists_are_stale():
+            self.enqueue_similar_artists_refresh()
 
-        return self.similar_artists
+        # Uses prefetched similarities if available
+        return {similarity.target_mbid: similarity.score for similarity in self.similarities.all()}
 
 
     def similarity_score(self, mbid):
@@ -206,6 +251,34 @@ class MusicBrainzArtist(models.Model):
         return self.name
 
 
+class MusicBrainzSimilarity(models.Model):
+    """ListenBrainz similarity data; one row per similar artist (up to 100 per source)."""
+    source=models.ForeignKey(MusicBrainzArtist, on_delete=models.CASCADE, related_name="similarities",
+                             db_column="source_mbid")
+    # Not a foreign key, since we don't import every MusicBrainz artist
+    target_mbid=models.CharField(max_length=40)
+    score=models.FloatField()
+
+    class Meta:
+        unique_together = (('source', 'target_mbid'),)
+        indexes = [
+            models.Index(name="mb_similarity_target", fields=["target_mbid", "source"]),
+        ]
+
+
+class MusicBrainzImport(models.Model):
+    """A MusicBrainz artist dump imported by update_musicbrainz_data."""
+    dump_id = models.CharField(max_length=40, unique=True) # e.g. 20261015-001001
+    imported_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def last_dump_id(cls):
+        return cls.objects.order_by('-dump_id').values_list('dump_id', flat=True).first()
+
+    def __str__(self):
+        return self.dump_id
+
+
 def prof_pic_name(instance, filename, suffix=""):
     return f"{slugify(f"{instance.name}{suffix}")}.jpg"
 
@@ -260,6 +333,62 @@ class Artist(CreationTrackingMixin):
         return self.name
 
 
+class ArtistRelevance(models.Model):
+    """
+    Precomputed Artist.similarity_score for a single searched mbid, i.e. the mean
+    similarity of the artist's similar_musicbrainz_artists to that mbid. Rows with
+    a score of 0 are not stored. Kept up to date by signals (see signals.py).
+    """
+    artist=models.ForeignKey(Artist, on_delete=models.CASCADE, related_name="relevances")
+    mbid=models.CharField(max_length=40)
+    score=models.FloatField()
+
+    class Meta:
+        unique_together = (('artist', 'mbid'),)
+        indexes = [
+            models.Index(name="artist_relevance_mbid", fields=["mbid", "artist"]),
+        ]
+
+
+    @classmethod
+    def scores_for_artist(cls, mb_artists):
+        # mb_artists: list of (mbid, similar_artists dict or None)
+        if not mb_artists:
+            return {}
+        totals = {}
+        for mbid, similar_artists in mb_artists:
+            totals[mbid] = totals.get(mbid, 0) + 1 # Max score, see MusicBrainzArtist.similarity_score
+            for similar_mbid, score in (similar_artists or {}).items():
+                if similar_mbid != mbid:
+                    totals[similar_mbid] = totals.get(similar_mbid, 0) + score
+        return {mbid: total / len(mb_artists) for mbid, total in totals.items() if total}
+
+
+    @classmethod
+    def rebuild(cls, artist_ids):
+        artist_ids = set(artist_ids)
+        if not artist_ids:
+            return
+        through = Artist.similar_musicbrainz_artists.through
+        links = list(through.objects.filter(artist_id__in=artist_ids).values_list('artist_id', 'musicbrainzartist_id'))
+
+        similar_artists = {mbid: {} for _, mbid in links}
+        for source_mbid, target_mbid, score in MusicBrainzSimilarity.objects.filter(
+                source_id__in=list(similar_artists)).values_list('source_id', 'target_mbid', 'score'):
+            similar_artists[source_mbid][target_mbid] = score
+
+        mb_artists = {artist_id: [] for artist_id in artist_ids}
+        for artist_id, mbid in links:
+            mb_artists[artist_id].append((mbid, similar_artists[mbid]))
+
+        with transaction.atomic():
+            cls.objects.filter(artist_id__in=artist_ids).delete()
+            cls.objects.bulk_create((cls(artist_id=artist_id, mbid=mbid, score=score)
+                                     for artist_id, mb_list in mb_artists.items()
+                                     for mbid, score in cls.scores_for_artist(mb_list).items()),
+                                    batch_size=1000)
+
+
 class AttrParser(HTMLParser):
     @classmethod
     def get_prop(cls, html, prop, req_tag=None, req_attr=None):
@@ -437,6 +566,9 @@ class ListenLink(EmbedLink):
     order=models.PositiveSmallIntegerField()
     artist=models.ForeignKey(Artist, on_delete=models.CASCADE)
 
+    class Meta:
+        ordering = ('order',)
+
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -502,6 +634,9 @@ class YoutubeLink(EmbedLink):
     order=models.PositiveSmallIntegerField()
     artist=models.ForeignKey(Artist, on_delete=models.CASCADE)
 
+    class Meta:
+        ordering = ('order',)
+
 
 class EmailCodeError(Exception):
     def __init__(self, message):
@@ -786,6 +921,81 @@ def poster_name_small(instance, filename):
     return poster_name(instance, filename, suffix="-small")
 
 
+class OrderedSum(Sum):
+    """Sum(..., order_by=...), adding the rows up in that order (PostgreSQL)."""
+    allow_order_by = True
+
+
+class ConcertQuerySet(models.QuerySet):
+    def update_is_public(self):
+        """Recomputes the denormalized Concert.is_public for these concerts (see signals.py)."""
+        temp_artists = SetOrder.objects.filter(concert=OuterRef('pk'), artist__is_temp_artist=True)
+        listed_venue = Venue.objects.filter(pk=OuterRef('venue'), is_verified=True, declined_listing=False)
+        verified_creator = UserProfile.objects.filter(pk=OuterRef('created_by'), artist_verification_status__in=(
+            ArtistVerificationStatus.VERIFIED,
+            ArtistVerificationStatus.INVITED
+        ))
+        is_public = ~Q(cancelled=True) & ~Exists(temp_artists) & Exists(listed_venue) & Exists(verified_creator)
+        return self.update(is_public=Case(When(is_public, then=Value(True)), default=Value(False)))
+
+
+    def with_relevance(self, searched_mbids):
+        """
+        Annotates `relevance`, equal to Concert.relevance_score(searched_mbids),
+        computed in the database from ArtistRelevance.
+        """
+        searched_mbids = set(searched_mbids)
+        if not searched_mbids:
+            return self.annotate(relevance=Value(0.0, output_field=FloatField()))
+
+        # Summed in a fixed order, so that the same concert always gets exactly the
+        # same float and the search's keyset cursor can compare it for equality
+        total_score = ArtistRelevance.objects.filter(
+            artist__set_order__concert=OuterRef('pk'), mbid__in=searched_mbids
+        ).order_by().values('artist__set_order__concert').annotate(
+            total=OrderedSum('score', order_by=('artist', 'mbid'))).values('total')
+        bill_size = SetOrder.objects.filter(
+            concert=OuterRef('pk')
+        ).order_by().values('concert').annotate(n=Count('pk')).values('n')
+
+        return self.annotate(relevance=Coalesce(
+            Subquery(total_score, output_field=FloatField())
+            / NullIf(Subquery(bill_size) * len(searched_mbids), 0),
+            0.0,
+            output_field=FloatField(),
+        ))
+
+
+    def with_followed_count(self, user_profile):
+        """Annotates `followed_count`, the number of artists on each bill that user_profile follows."""
+        followed = SetOrder.objects.filter(
+            concert=OuterRef('pk'), artist__followers=user_profile
+        ).order_by().values('concert').annotate(n=Count('pk')).values('n')
+        return self.annotate(followed_count=Coalesce(Subquery(followed), 0))
+
+
+    def with_shuffle_key(self, seed):
+        """Annotates `shuffle_key`, a pseudo-random sort key that is stable for a given seed."""
+        return self.annotate(shuffle_key=MD5(Concat(Value(str(seed)), Cast('pk', models.CharField()))))
+
+
+    def with_card_data(self, searched_mbids=()):
+        """
+        Loads everything concert_card.html needs in a fixed number of queries.
+        The similar musicbrainz artists only get their similarities to
+        searched_mbids, since that's all the card displays; pass None to load
+        all of them.
+        """
+        similarities = MusicBrainzSimilarity.objects.all()
+        if searched_mbids is not None:
+            similarities = similarities.filter(target_mbid__in=searched_mbids)
+        set_orders = SetOrder.objects.select_related('artist').prefetch_related(
+            'artist__listenlink_set',
+            Prefetch('artist__similar_musicbrainz_artists__similarities', queryset=similarities),
+        )
+        return self.select_related('venue').prefetch_related(Prefetch('setorder_set', queryset=set_orders))
+
+
 class Concert(CreationTrackingMixin):
     poster=JPEGImageField(help_text=f"{IMAGE_HELP_TEXT} Vertical or square orientations display best.",
                           upload_to=poster_name)
@@ -809,28 +1019,48 @@ class Concert(CreationTrackingMixin):
                                  help_text="50 characters of vibes.")
     announced=models.DateField(null=True, editable=False)
     shared=models.DateField(null=True, editable=False)
+    # Denormalized from the bill, venue, creator and cancellation; kept up to
+    # date by signals calling ConcertQuerySet.update_is_public
+    is_public=models.BooleanField(default=False, editable=False)
+
+    objects = ConcertQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(name="concert_public_date", fields=["date"], condition=Q(is_public=True)),
+        ]
 
     @classmethod
     def publically_visible(cls):
-        query = cls.objects.exclude(
-            Q(artists__is_temp_artist=True) |
-            Q(venue__is_verified=False) |
-            Q(venue__declined_listing=True) |
-            Q(cancelled=True)
-        )
-        query = query.filter(created_by__artist_verification_status__in=(
-            ArtistVerificationStatus.VERIFIED,
-            ArtistVerificationStatus.INVITED
-        ))
-        return query
+        return cls.objects.filter(is_public=True)
+
+
+    @classmethod
+    def load_conflicts(cls, concerts):
+        """Fills in `conflicts` for each of the concerts with a single query."""
+        concerts = list(concerts)
+        if not concerts:
+            return concerts
+        by_venue_and_date = {}
+        candidates = cls.objects.filter(
+            venue__in={c.venue_id for c in concerts}, date__in={c.date for c in concerts}
+        ).exclude(cancelled=True).select_related('venue').prefetch_related('setorder_set__artist')
+        for candidate in candidates:
+            by_venue_and_date.setdefault((candidate.venue_id, candidate.date), []).append(candidate)
+        for concert in concerts:
+            concert._conflicts = [c for c in by_venue_and_date.get((concert.venue_id, concert.date), [])
+                                  if c.pk != concert.pk]
+        return concerts
 
 
     def relevance_score(self, searched_mbids):
         return mean(artist.similarity_score(searched_mbids)
-                    for artist in self.artists.all())
+                    for artist in self.sorted_artists)
 
     @property
     def sorted_artists(self):
+        if 'setorder_set' in getattr(self, '_prefetched_objects_cache', {}):
+            return [set_order.artist for set_order in self.setorder_set.all()]
         return self.artists.order_by('set_order')
 
     @property
@@ -841,6 +1071,8 @@ class Concert(CreationTrackingMixin):
 
     @property
     def conflicts(self):
+        if hasattr(self, '_conflicts'): # see load_conflicts
+            return self._conflicts
         if self.venue and self.date:
             conflict_concerts = Concert.objects.filter(venue=self.venue, date=self.date).exclude(cancelled=True)
             if self.pk:
@@ -849,10 +1081,10 @@ class Concert(CreationTrackingMixin):
         return []
 
     def display_str(self):
-        return f"{', '.join((str(a) for a in self.artists.all()))} | {self.date.strftime('%a %b %d')} | {str(self.venue)}"
+        return f"{', '.join((str(a) for a in self.sorted_artists))} | {self.date.strftime('%a %b %d')} | {str(self.venue)}"
 
     def __str__(self):
-        return f"{', '.join((str(a) for a in self.artists.all()))} at {str(self.venue)} {str(self.date)}"
+        return f"{', '.join((str(a) for a in self.sorted_artists))} at {str(self.venue)} {str(self.date)}"
 
 
 
@@ -916,3 +1148,31 @@ class Contact(models.Model):
 
     def __str__(self):
         return f"[{self.get_type_display()}] {self.subject}"
+
+
+class WeeklySendRun(models.Model):
+    """
+    One sending of the weekly recommendation email. Recipients are recorded in
+    the deliveries ledger as they're sent, so a run that's interrupted can be
+    resumed without emailing anybody twice; finished_at is set, along with the
+    concerts' announced/shared dates, once everyone has been sent to.
+
+    The counts are only filled in when the run is split into shard tasks.
+    """
+    date = models.DateField(unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    recipient_count = models.IntegerField(null=True, blank=True)
+    shard_count = models.IntegerField(default=0)
+    shards_finished = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Weekly email for {self.date}"
+
+
+class WeeklySendDelivery(models.Model):
+    class Meta:
+        unique_together = (('run', 'user_profile'),)
+    run = models.ForeignKey(WeeklySendRun, on_delete=models.CASCADE, related_name='deliveries')
+    user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
+    sent_at = models.DateTimeField(auto_now_add=True)
@@ -2,6 +2,8 @@ import requests
 import logging
 
 from django.conf import settings
+from django.core.cache import cache
+from django.tasks import task
 
 
 AUTH_HEADER = {
@@ -11,34 +13,99 @@ AUTH_HEADER = {
 
 logger = logging.getLogger(__name__)
 
+TIMEOUT_SECONDS = 10
+# How long a queued refresh blocks others for the same mbid. Only released
+# early on success, so failures back off for this long before retrying.
+REFRESH_LOCK_SECONDS = 15 * 60
+
+SIMILAR_ARTISTS_URL = "https://labs.api.listenbrainz.org/similar-artists/json"
+SIMILAR_ARTISTS_ALGORITHM = "session_based_days_7500_session_300_contribution_5_threshold_10_limit_100_filter_True_skip_30"
+# The labs API caps the rows in a response, at 100 similar artists per mbid
+MAX_BATCH_SIZE = 25
+
+
+def _request_similar_artists(mbids):
+    """Returns the API's list of similar artist rows, or None on failure."""
+    params = {
+        "artist_mbids": ",".join(mbids),
+        "algorithm": SIMILAR_ARTISTS_ALGORITHM,
+    }
+    try:
+        response = requests.get(SIMILAR_ARTISTS_URL, params, headers=AUTH_HEADER, timeout=TIMEOUT_SECONDS)
+    except requests.RequestException as e:
+        logger.error(f"MusicBrainz API for finding similar artists failed: {str(e)}")
+        return None
+
+    if response.status_code != 200:
+        logger.error(f"MusicBrainz API for finding similar artists returned status code {response.status_code}.")
+        return None
+    return response.json()
+
+
+def _normalized_scores(artist_list):
+    if not artist_list:
+        return {}
+    max_score = max(a['score'] for a in artist_list)
+    return {a['artist_mbid']: a['score']/max_score for a in artist_list}
+
+
 def get_similar_artists(mbid=None):
     """Similarity scores from the Musicbrainz algorithm, described here:
     https://community.metabrainz.org/t/how-does-similar-artists-work/678642/3
 
     Returns a dictionary of {mbid: similarity_score}
     """
-    url = "https://labs.api.listenbrainz.org/similar-artists/json"
-    params = {
-        "artist_mbids": mbid,
-        "algorithm": "session_based_days_7500_session_300_contribution_5_threshold_10_limit_100_filter_True_skip_30"
-    }
-    response = requests.get(url, params, headers=AUTH_HEADER)
+    artist_list = _request_similar_artists([mbid])
+    if artist_list is None:
+        return None
 
-    if response.status_code != 200:
-        logger.error(f"MusicBrainz API for finding similar artists returned status code {response.status_code}.")
+    try:
+        return _normalized_scores(artist_list)
+    except KeyError:
+        logger.error("MusicBrainz API for finding similar artists returned unexpected JSON.")
+        return None
+
+
+def get_similar_artists_batch(mbids):
+    """get_similar_artists for up to MAX_BATCH_SIZE mbids in a single request.
+
+    Returns a dictionary of {mbid: {similar_mbid: similarity_score}}, with an
+    empty dict for mbids the API has no data on, or None if the request failed.
+    """
+    artist_list = _request_similar_artists(mbids)
+    if artist_list is None:
         return None
 
     try:
-        artist_list = response.json()
-        if not artist_list:
-            return {}
-        max_score = max(a['score'] for a in artist_list)
-        return {a['artist_mbid']: a['score']/max_score for a in artist_list}
+        # Rows for every requested artist come back in one list, each tagged with its source
+        rows_by_mbid = {mbid: [] for mbid in mbids}
+        for a in artist_list:
+            rows_by_mbid.setdefault(a['reference_mbid'], []).append(a)
+        return {mbid: _normalized_scores(rows) for mbid, rows in rows_by_mbid.items()}
     except KeyError:
         logger.error("MusicBrainz API for finding similar artists returned unexpected JSON.")
         return None
 
 
+def refresh_lock_key(mbid):
+    return f"similar_artists_refresh:{mbid}"
+
+
+@task()
+def refresh_similar_artists(mbid):
+    """Enqueued by MusicBrainzArtist.get_similar_artists when its data is stale."""
+    from findshows.models import MusicBrainzArtist # models imports this module
+
+    similar_artists = get_similar_artists(mbid)
+    if similar_artists is None:
+        return False
+    mb_artist = MusicBrainzArtist.objects.filter(mbid=mbid).first()
+    if mb_artist is not None:
+        mb_artist.set_similar_artists(similar_artists)
+    cache.delete(refresh_lock_key(mbid))
+    return True
+
+
 # Test artist IDs
 # Nanci Griffith 'b9ffd0e7-7f95-46db-bc1c-8094d459f084'
 # Mary Chapin Carpenter 'ba1bf556-2af2-4772-835f-ed2e15070758'
@@ -0,0 +1,179 @@
+"""
+Parsing for the MusicBrainz and ListenBrainz data dumps imported by
+update_musicbrainz_data. Nothing here imports Django, so that it can run in
+worker processes.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import itertools
+import json
+import multiprocessing
+import queue
+import threading
+
+import numpy as np
+
+
+# Lines of the artist dump parsed per task; each line is a few KB of JSON
+CHUNK_LINES = 1000
+# Lines of the listen statistics counted at a time; each line is a user's top artists
+STATS_CHUNK_LINES = 1000
+
+
+def _mbid_key(mbid):
+    """The 16 bytes of a UUID mbid, or None if it isn't one."""
+    try:
+        key = bytes.fromhex(mbid.replace('-', ''))
+    except ValueError:
+        return None
+    return key if len(key) == 16 else None
+
+
+class MbidSet:
+    """
+    An immutable set of mbids stored as a sorted array of their 16-byte UUIDs,
+    so it takes 16 bytes per mbid (rather than the ~100 of a str in a set) and
+    is cheap to send to worker processes. Strings that aren't UUIDs are never
+    members.
+    """
+    def __init__(self, keys):
+        self.keys = keys
+
+
+    def __len__(self):
+        return len(self.keys)
+
+
+    def __contains__(self, mbid):
+        return bool(self.contains([mbid])[0])
+
+
+    def contains(self, mbids):
+        """A boolean array of whether each of mbids is in the set."""
+        keys = [_mbid_key(mbid) for mbid in mbids]
+        if not len(self.keys):
+            return np.zeros(len(keys), dtype=bool)
+        valid = np.array([key is not None for key in keys], dtype=bool)
+        keys = np.array([key or b"" for key in keys], dtype='S16')
+        indexes = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return valid & (self.keys[indexes] == keys)
+
+
+def _merge_counts(keys, counts):
+    """Merges lists of (sorted, unique) key arrays and their parallel count arrays into one pair."""
+    keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+    return keys, np.bincount(inverse, weights=np.concatenate(counts), minlength=len(keys)).astype(np.uint32)
+
+
+def count_listeners(f, min_listeners):
+    """
+    Counts each artist's listeners in ListenBrainz's artists_all_time.jsonl
+    statistics, and returns an MbidSet of the artists with at least
+    min_listeners. The counts are kept as a sorted array of UUIDs with a
+    parallel array of counts, so memory use is ~20 bytes per artist. Each chunk
+    of lines is counted on its own, and the chunks' counts are only merged into
+    the totals once there are as many of them as there are totals, so that every
+    count is merged a logarithmic rather than a linear number of times.
+    """
+    keys = np.empty(0, dtype='S16')
+    counts = np.empty(0, dtype=np.uint32)
+    pending_keys, pending_counts = [], []
+    pending = 0
+    for lines in itertools.batched(f, STATS_CHUNK_LINES):
+        chunk_keys = np.array([key for line in lines for datum in json.loads(line)['data']
+                               if (key := _mbid_key(datum['artist_mbid'])) is not None], dtype='S16')
+        chunk_keys, chunk_counts = np.unique(chunk_keys, return_counts=True)
+        pending_keys.append(chunk_keys)
+        pending_counts.append(chunk_counts.astype(np.uint32))
+        pending += len(chunk_keys)
+        if pending >= len(keys):
+            keys, counts = _merge_counts([keys, *pending_keys], [counts, *pending_counts])
+            pending_keys, pending_counts = [], []
+            pending = 0
+    keys, counts = _merge_counts([keys, *pending_keys], [counts, *pending_counts])
+    return MbidSet(keys[counts >= min_listeners])
+
+# Set in each worker process by _init_worker
+_eligible_mbids = None
+
+
+def _init_worker(eligible_mbids):
+    global _eligible_mbids
+    _eligible_mbids = eligible_mbids
+
+
+def content_hash(name, disambiguation):
+    """Signed 64-bit hash of the fields we import, to fit a BigIntegerField."""
+    digest = hashlib.blake2b(json.dumps([name, disambiguation]).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, signed=True)
+
+
+def parse_artist_lines(lines):
+    """
+    Returns (mbid, name, disambiguation, content_hash) for each line of the
+    artist dump whose mbid is eligible.
+    """
+    artists_json = [json.loads(line) for line in lines]
+    eligible = _eligible_mbids.contains([artist_json['id'] for artist_json in artists_json])
+    return [(artist_json['id'], artist_json['name'], artist_json['disambiguation'],
+             content_hash(artist_json['name'], artist_json['disambiguation']))
+            for artist_json, is_eligible in zip(artists_json, eligible) if is_eligible]
+
+
+def _put_unless_stopped(chunks, chunk, stop):
+    while not stop.is_set():
+        try:
+            chunks.put(chunk, timeout=1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _read_chunks(f, chunks, stop, errors):
+    try:
+        for chunk in itertools.batched(f, CHUNK_LINES):
+            if not _put_unless_stopped(chunks, chunk, stop):
+                return
+    except Exception as e:
+        errors.append(e)
+    _put_unless_stopped(chunks, None, stop)
+
+
+def parse_artist_dump(f, eligible_mbids, workers):
+    """
+    Yields (lines read, [(mbid, name, disambiguation, content_hash), ...]) for
+    each chunk of the artist dump f, in order, keeping only artists whose mbid
+    is in eligible_mbids (an MbidSet). A thread reads (and decompresses) f into a bounded
+    queue of chunks while a pool of worker processes parses them, and only so
+    many chunks are queued or being parsed at once, so memory use doesn't grow
+    with the size of the dump.
+
+    The workers are started by a forkserver rather than forked from this
+    process, since they're started as chunks are submitted, by which time the
+    reader thread may be holding locks that a forked copy would never release.
+    """
+    max_chunks = workers * 2
+    chunks = queue.Queue(maxsize=max_chunks)
+    stop = threading.Event()
+    errors = []
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('forkserver'),
+                               initializer=_init_worker, initargs=(eligible_mbids,))
+    reader = threading.Thread(target=_read_chunks, args=(f, chunks, stop, errors), daemon=True)
+    reader.start()
+    try:
+        parsing = deque() # (lines, future), oldest first
+        while (chunk := chunks.get()) is not None:
+            parsing.append((len(chunk), pool.submit(parse_artist_lines, chunk)))
+            if len(parsing) >= max_chunks:
+                lines, future = parsing.popleft()
+                yield lines, future.result()
+        while parsing:
+            lines, future = parsing.popleft()
+            yield lines, future.result()
+    finally:
+        stop.set()
+        pool.shutdown(cancel_futures=True)
+    if errors:
+        raise errors[0]
@@ -0,0 +1,133 @@
+"""
+Ways for update_musicbrainz_data to save (mbid, name, disambiguation,
+content_hash) tuples from the artist dump as MusicBrainzArtists. Each is a
+context manager: load() batches of tuples, then finish() returns a dict of
+counts to report.
+
+Only new and changed artists are written. Normally an artist has changed if
+its stored content_hash differs; with full=True its name and disambiguation
+are compared too, in case the stored hashes can't be trusted.
+"""
+import io
+
+from django.db import connection
+
+from findshows.models import MusicBrainzArtist
+
+
+class OrmLoader:
+    """Looks up each batch's stored artists and upserts the changed ones with bulk_create."""
+    def __init__(self, full=False):
+        self.compared_fields = ('name', 'disambiguation', 'content_hash') if full else ('content_hash',)
+        self.inserted = self.updated = self.unchanged = 0
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+    def load(self, artists):
+        stored = {mbid: tuple(values) for mbid, *values in MusicBrainzArtist.objects.filter(
+            mbid__in=[artist[0] for artist in artists]).values_list('mbid', *self.compared_fields)}
+        changed = []
+        for artist in artists:
+            if artist[0] not in stored:
+                self.inserted += 1
+            elif stored[artist[0]] != artist[-len(self.compared_fields):]:
+                self.updated += 1
+            else:
+                self.unchanged += 1
+                continue
+            changed.append(artist)
+        MusicBrainzArtist.objects.bulk_create((MusicBrainzArtist(mbid=mbid, name=name, disambiguation=disambiguation,
+                                                                 content_hash=content_hash)
+                                               for mbid, name, disambiguation, content_hash in changed),
+                                              update_conflicts=True,
+                                              update_fields=('name', 'disambiguation', 'content_hash'),
+                                              unique_fields=('mbid',))
+
+
+    def finish(self):
+        return {'inserted': self.inserted, 'updated': self.updated, 'unchanged': self.unchanged}
+
+
+def _copy_value(value):
+    """value in PostgreSQL's COPY text format."""
+    if value is None:
+        return r"\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+class CopyLoader:
+    """
+    Streams each batch into a staging table with COPY, then merges the staging
+    table into MusicBrainzArtist with a single INSERT ... ON CONFLICT that only
+    updates artists that changed. Unchanged rows aren't rewritten, which
+    matters because the name's trigram index is built without fastupdate.
+    PostgreSQL only.
+
+    The staging table is a temporary table, so it's never written to the WAL
+    (like an unlogged table) and is private to this connection.
+    """
+    STAGING_TABLE = "musicbrainz_artist_staging"
+
+    def __init__(self, full=False):
+        self.full = full
+        self.staged = 0
+        self.table = connection.ops.quote_name(MusicBrainzArtist._meta.db_table)
+
+
+    def __enter__(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.STAGING_TABLE}")
+            cursor.execute(f"CREATE TEMPORARY TABLE {self.STAGING_TABLE} "
+                           "(mbid varchar(40) NOT NULL, name varchar NOT NULL, disambiguation varchar, "
+                           "content_hash bigint NOT NULL)")
+        return self
+
+
+    def __exit__(self, *exc_info):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.STAGING_TABLE}")
+
+
+    def load(self, artists):
+        rows = io.StringIO("".join("\t".join(_copy_value(value) for value in artist) + "\n"
+                                   for artist in artists))
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {self.STAGING_TABLE} (mbid, name, disambiguation, content_hash) FROM STDIN", rows)
+        self.staged += len(artists)
+
+
+    def finish(self):
+        compared_fields = ('name', 'disambiguation', 'content_hash') if self.full else ('content_hash',)
+        stored = ", ".join(f"{self.table}.{field}" for field in compared_fields)
+        excluded = ", ".join(f"EXCLUDED.{field}" for field in compared_fields)
+        with connection.cursor() as cursor:
+            # xmax is 0 for newly inserted rows; rows the WHERE skipped aren't returned at all
+            cursor.execute(f"""
+                WITH merged AS (
+                    INSERT INTO {self.table} (mbid, name, disambiguation, content_hash)
+                    SELECT DISTINCT ON (mbid) mbid, name, disambiguation, content_hash FROM {self.STAGING_TABLE}
+                    ON CONFLICT (mbid) DO UPDATE
+                        SET name = EXCLUDED.name, disambiguation = EXCLUDED.disambiguation,
+                            content_hash = EXCLUDED.content_hash
+                        WHERE ROW({stored}) IS DISTINCT FROM ROW({excluded})
+                    RETURNING xmax = 0 AS inserted
+                )
+                SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+            """)
+            inserted, updated = cursor.fetchone()
+            cursor.execute(f"ANALYZE {self.table}")
+        return {'inserted': inserted, 'updated': updated, 'unchanged': self.staged - inserted - updated}
+
+
+LOADERS = {
+    'orm': OrmLoader,
+    'copy': CopyLoader,
+}
@@ -0,0 +1,66 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Spaces out calls to wait() across threads to at most `rate` per second."""
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait_until = max(now, self.next_time)
+            self.next_time = wait_until + self.interval
+        time.sleep(wait_until - now)
+
+
+class StageStats:
+    """
+    Thread-safe item count and busy time for one stage of a pipeline. Busy
+    time is summed across every thread working on the stage, so it can be
+    larger than the wall-clock time when the stage runs in parallel.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.busy_seconds = 0
+        self.start_time = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def add(self, count, busy_seconds):
+        with self.lock:
+            self.count += count
+            self.busy_seconds += busy_seconds
+
+
+    def summary(self):
+        wall_seconds = time.monotonic() - self.start_time
+        rate = self.count / wall_seconds if wall_seconds else 0
+        return (f"{self.name}: {self.count} in {wall_seconds:.1f}s "
+                f"({rate:.1f}/s, {self.busy_seconds:.1f}s busy)")
+
+
+class PipelineStats:
+    """StageStats for each stage of a pipeline by name, created on first use."""
+    def __init__(self, *names):
+        self.stages = {}
+        self.lock = threading.Lock()
+        for name in names:
+            self[name]
+
+
+    def __getitem__(self, name):
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = StageStats(name)
+            return self.stages[name]
+
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.stages.values()))
@@ -0,0 +1,136 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from smtplib import SMTPException, SMTPResponseException, SMTPServerDisconnected
+
+from django.conf import settings
+from django.core.mail.backends import smtp
+from django.core.mail.backends.base import BaseEmailBackend
+
+logger = logging.getLogger(__name__)
+
+
+class NoRecipientsError(ValueError):
+    pass
+
+
+def is_transient(error):
+    """Whether sending again over a new connection might succeed."""
+    if isinstance(error, SMTPResponseException):
+        return 400 <= error.smtp_code < 500 # 4xx replies are temporary failures
+    if isinstance(error, SMTPException): # Also an OSError, but e.g. refused recipients stay refused
+        return isinstance(error, SMTPServerDisconnected)
+    return isinstance(error, OSError) # Network trouble
+
+
+class EmailBackend(BaseEmailBackend):
+    """
+    SMTP email backend backed by a threaded connection pool: each batch of
+    messages is sent over up to EMAIL_POOL_SIZE persistent connections at once,
+    so that the relay's latency is spent waiting on several SMTP dialogues at
+    once rather than one after another. Takes the same options as Django's SMTP
+    backend.
+
+    Each connection is a Django (blocking smtplib) SMTP backend driven by its own
+    worker thread, which takes the next message from a shared queue; nothing is
+    pipelined within a connection. No event loop is involved, so this can be
+    called from async code like any other blocking backend (e.g. wrapped in
+    sync_to_async). A connection that fails with a transient error is closed
+    and reopened, and the message retried, up to EMAIL_SEND_RETRIES times.
+    Connections stay open between calls to send_messages until close().
+    """
+    def __init__(self, fail_silently=False, pool_size=None, retries=None, **kwargs):
+        super().__init__(fail_silently=fail_silently)
+        self.pool_size = pool_size or settings.EMAIL_POOL_SIZE
+        self.retries = settings.EMAIL_SEND_RETRIES if retries is None else retries
+        self.connection_kwargs = kwargs
+        self.idle_connections = []
+        self._idle_lock = threading.Lock()
+
+
+    def open(self):
+        # Connections are opened as the pool needs them
+        return False
+
+
+    def close(self):
+        with self._idle_lock:
+            connections, self.idle_connections = self.idle_connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                if not self.fail_silently:
+                    raise
+
+
+    def send_messages(self, email_messages):
+        results = self.send_messages_with_results(email_messages)
+        errors = [error for error in results if error is not None and not isinstance(error, NoRecipientsError)]
+        if errors and not self.fail_silently:
+            raise errors[0]
+        return results.count(None)
+
+
+    def send_messages_with_results(self, email_messages):
+        """
+        Sends email_messages and returns a list with, for each message in order,
+        None if it was sent or the exception that stopped it being sent. Never
+        raises for a single message's failure. Blocks until every message is done.
+        """
+        email_messages = list(email_messages)
+        if not email_messages:
+            return []
+        results = [None] * len(email_messages)
+        pending = queue.SimpleQueue()
+        for item in enumerate(email_messages):
+            pending.put(item)
+        workers = min(self.pool_size, len(email_messages))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="smtp-pool") as executor:
+            for future in [executor.submit(self._send_from_queue, pending, results) for _ in range(workers)]:
+                future.result()
+        return results
+
+
+    def _send_from_queue(self, pending, results):
+        with self._idle_lock:
+            connection = self.idle_connections.pop() if self.idle_connections else None
+        try:
+            while True:
+                try:
+                    index, email_message = pending.get_nowait()
+                except queue.Empty:
+                    return
+                if not email_message.recipients():
+                    results[index] = NoRecipientsError("Message has no recipients")
+                    continue
+                for attempt in range(self.retries + 1):
+                    try:
+                        if connection is None:
+                            connection = smtp.EmailBackend(fail_silently=False, **self.connection_kwargs)
+                            connection.open()
+                        connection.send_messages([email_message])
+                        results[index] = None
+                        break
+                    except Exception as e:
+                        results[index] = e
+                        if not is_transient(e):
+                            break
+                        logger.info(f"Reconnecting after email failure (attempt {attempt + 1}): {str(e)}")
+                        self._discard(connection)
+                        connection = None
+        finally:
+            if connection is not None:
+                with self._idle_lock:
+                    self.idle_connections.append(connection)
+
+
+    @staticmethod
+    def _discard(connection):
+        if connection is None:
+            return
+        try:
+            connection.close()
+        except Exception:
+            pass # It's already broken
@@ -0,0 +1,70 @@
+import numpy as np
+
+from findshows.models import ArtistRelevance
+
+
+class ConcertRelevanceIndex:
+    """
+    Sparse concert x mbid relevance matrix for a fixed set of concerts, where
+    an entry is the sum of ArtistRelevance scores over the bill divided by the
+    bill size. The relevance of every concert to a set of searched mbids is then
+    a single sparse matrix-vector product, and gives the same numbers as
+    Concert.relevance_score and ConcertQuerySet.with_relevance. concerts must
+    have their bills loaded (see ConcertQuerySet.with_card_data).
+
+    ArtistRelevance is kept current by signals, so building a new index picks
+    up any changes; build one per run rather than keeping it around.
+
+    If mbids (an iterable or a queryset of mbids) is given, only those columns
+    are kept, and scores() must only be asked about those mbids.
+    """
+    def __init__(self, concerts, mbids=None):
+        bills = {concert.pk: [artist.pk for artist in concert.sorted_artists] for concert in concerts}
+
+        relevances = ArtistRelevance.objects.filter(artist__in={pk for bill in bills.values() for pk in bill})
+        if mbids is not None:
+            relevances = relevances.filter(mbid__in=mbids)
+        artist_relevances = {} # {artist_id: [(mbid, score), ...]}
+        # Ordered so that the floats are always added up in the same order
+        for artist_id, mbid, score in relevances.order_by('artist', 'mbid').values_list('artist', 'mbid', 'score'):
+            artist_relevances.setdefault(artist_id, []).append((mbid, score))
+
+        self.concert_pks = np.array(list(bills), dtype=np.int64)
+        self.columns = {} # {mbid: column number}
+        rows, cols, weights = [], [], []
+        for row, bill in enumerate(bills.values()):
+            for artist_id in bill:
+                for mbid, score in artist_relevances.get(artist_id, ()):
+                    rows.append(row)
+                    cols.append(self.columns.setdefault(mbid, len(self.columns)))
+                    weights.append(score / len(bill))
+
+        # Compressed sparse columns, since scoring only reads the searched mbids'
+        # columns: column j's entries are rows/weights[indptr[j]:indptr[j + 1]].
+        # Entries for the same cell (an mbid shared by several artists on a bill) are summed.
+        cells, cell_of_entry = np.unique(np.array(cols, dtype=np.int64) * len(bills) + np.array(rows, dtype=np.int64),
+                                         return_inverse=True)
+        self.rows = cells % max(len(bills), 1)
+        self.weights = np.bincount(cell_of_entry, weights=weights, minlength=len(cells))
+        self.indptr = np.searchsorted(cells // max(len(bills), 1), np.arange(len(self.columns) + 1)).tolist()
+
+
+    def __len__(self):
+        """Number of nonzero (concert, mbid) entries."""
+        return len(self.rows)
+
+
+    def scores(self, searched_mbids):
+        """Returns {concert_pk: relevance}, omitting concerts with a relevance of 0."""
+        searched_mbids = set(searched_mbids)
+        # In column order rather than the set's, which changes from one process to the next
+        columns = [slice(self.indptr[j], self.indptr[j + 1])
+                   for j in sorted(self.columns[mbid] for mbid in searched_mbids if mbid in self.columns)]
+        if not columns:
+            return {}
+        # The matrix times the searched mbids' indicator vector, over the number searched
+        totals = np.bincount(np.concatenate([self.rows[column] for column in columns]),
+                             weights=np.concatenate([self.weights[column] for column in columns]),
+                             minlength=len(self.concert_pks))
+        nonzero = np.flatnonzero(totals)
+        return dict(zip(self.concert_pks[nonzero].tolist(), (totals[nonzero] / len(searched_mbids)).tolist()))
@@ -0,0 +1,41 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Every cached search result is keyed on this version, so bumping it
+# invalidates all of them at once without having to know their keys.
+VERSION_KEY = "concert_search_version"
+
+
+def get_version(key=VERSION_KEY):
+    version = cache.get(key)
+    if version is None:
+        # Seeded from the clock so an evicted version never comes back as one
+        # that stale results were stored under.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_version(key=VERSION_KEY):
+    try:
+        cache.incr(key)
+    except ValueError: # Key isn't set
+        cache.set(key, time.time_ns(), None)
+
+
+def _result_key(params):
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    return f"concert_search:{get_version()}:{digest}"
+
+
+def get_results(params):
+    return cache.get(_result_key(params))
+
+
+def set_results(params, results):
+    cache.set(_result_key(params), results, settings.CONCERT_SEARCH_CACHE_SECONDS)
@@ -0,0 +1,130 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from findshows import mod_digest, search_cache
+from findshows.models import Artist, ArtistLinkingInfo, ArtistRelevance, Concert, Contact, MusicBrainzArtist, SetOrder, User, UserProfile, Venue
+
+
+@receiver(m2m_changed, sender=Artist.similar_musicbrainz_artists.through)
+def update_relevance_on_similar_artists_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # pk_set isn't provided for clears, so remember who was affected
+        instance._cleared_artist_ids = list(instance.artist_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        ArtistRelevance.rebuild([instance.pk])
+    elif action == 'post_clear':
+        ArtistRelevance.rebuild(getattr(instance, '_cleared_artist_ids', []))
+    elif pk_set:
+        ArtistRelevance.rebuild(pk_set)
+    search_cache.bump_version()
+
+
+@receiver(post_save, sender=MusicBrainzArtist)
+def update_relevance_on_musicbrainz_artist_save(sender, instance, created, raw, **kwargs):
+    if created or raw:
+        return # nothing can reference it yet
+    artist_ids = instance.artist_set.values_list('pk', flat=True)
+    if artist_ids:
+        ArtistRelevance.rebuild(artist_ids)
+        search_cache.bump_version()
+
+
+# Concert.is_public receivers are connected before the search cache's, so the
+# cache is invalidated after visibility is updated
+
+@receiver(post_save, sender=Concert)
+def update_is_public_on_concert_save(sender, instance, **kwargs):
+    Concert.objects.filter(pk=instance.pk).update_is_public()
+
+
+@receiver(post_save, sender=SetOrder)
+@receiver(post_delete, sender=SetOrder)
+def update_is_public_on_set_order_change(sender, instance, **kwargs):
+    Concert.objects.filter(pk=instance.concert_id).update_is_public()
+
+
+@receiver(post_save, sender=Artist)
+def update_is_public_on_artist_save(sender, instance, **kwargs):
+    Concert.objects.filter(artists=instance).update_is_public()
+
+
+@receiver(post_save, sender=Venue)
+def update_is_public_on_venue_save(sender, instance, **kwargs):
+    Concert.objects.filter(venue=instance).update_is_public()
+
+
+@receiver(post_save, sender=Concert)
+@receiver(post_save, sender=SetOrder)
+@receiver(post_save, sender=Venue)
+@receiver(post_save, sender=Artist)
+@receiver(post_delete, sender=Concert)
+@receiver(post_delete, sender=SetOrder)
+@receiver(post_delete, sender=Venue)
+@receiver(post_delete, sender=Artist)
+def invalidate_search_cache(sender, **kwargs):
+    search_cache.bump_version()
+
+
+@receiver(m2m_changed, sender=Concert.artists.through)
+def update_on_lineup_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        Concert.objects.filter(pk=instance.pk).update_is_public()
+    elif pk_set:
+        Concert.objects.filter(pk__in=pk_set).update_is_public()
+    search_cache.bump_version()
+
+
+@receiver(pre_save, sender=UserProfile)
+def check_verification_status_change(sender, instance, raw, **kwargs):
+    if raw or instance.pk is None:
+        return
+    old_status = (UserProfile.objects.filter(pk=instance.pk)
+                  .values_list('artist_verification_status', flat=True).first())
+    instance._verification_status_changed = old_status != instance.artist_verification_status
+
+
+@receiver(post_save, sender=UserProfile)
+def update_on_verification_change(sender, instance, **kwargs):
+    # Only concerts created by verified/invited users are publically visible
+    if getattr(instance, '_verification_status_changed', False):
+        instance._verification_status_changed = False
+        Concert.objects.filter(created_by=instance).update_is_public()
+        search_cache.bump_version()
+
+
+# Anything shown in the mod digest, including the emails of users managing artists
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=ArtistLinkingInfo)
+@receiver(post_save, sender=Concert)
+@receiver(post_save, sender=Contact)
+@receiver(post_save, sender=SetOrder)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=Venue)
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=ArtistLinkingInfo)
+@receiver(post_delete, sender=Concert)
+@receiver(post_delete, sender=Contact)
+@receiver(post_delete, sender=SetOrder)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=Venue)
+def invalidate_mod_digest(sender, **kwargs):
+    mod_digest.bump_version()
+
+
+@receiver(post_save, sender=User)
+def invalidate_mod_digest_on_user_change(sender, update_fields, **kwargs):
+    # Logging in saves just last_login, which the digest doesn't show
+    if update_fields is None or not update_fields <= {'last_login'}:
+        mod_digest.bump_version()
+
+
+@receiver(m2m_changed, sender=UserProfile.managed_artists.through)
+@receiver(m2m_changed, sender=Concert.artists.through)
+def invalidate_mod_digest_on_m2m_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        mod_digest.bump_version()
@@ -5,6 +5,7 @@ function update_url(pathInfo, expectedRequestPath, finalBasePath) {
         pathInfo.finalRequestPath.slice(pathInfo.requestPath.length)
     );
     params.delete('mb_search');
+    params.delete('cursor');
     if (params.get('is_date_range') !== 'true') {
         params.delete('is_date_range');
         params.delete('end_date');
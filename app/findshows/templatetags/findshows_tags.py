@@ -16,7 +16,7 @@ register = template.Library()
 
 @register.inclusion_tag("findshows/partials/preview_player.html")
 def preview_player(artist, mini=False):
-    links = artist.listenlink_set.order_by('order')
+    links = artist.listenlink_set.all() # Uses prefetched links if available
     if mini and len(links) > 0:
         links = [links[0]]
     return {'urls_and_heights': ((l.get_url_for_display(mini), l.get_height(mini)) for l in links)}
@@ -24,7 +24,7 @@ def preview_player(artist, mini=False):
 
 @register.inclusion_tag("findshows/partials/youtube_embeds.html")
 def youtube_embeds(artist):
-    return {'urls': (l.get_url_for_display() for l in artist.youtubelink_set.order_by('order'))}
+    return {'urls': (l.get_url_for_display() for l in artist.youtubelink_set.all())}
 
 
 @register.filter
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import tempfile
+from unittest.mock import patch
+
+import requests
+from django.test import TestCase
+
+from findshows import dump_cache
+from findshows.dump_cache import ChecksumError, DumpCache
+
+
+class FakeResponse:
+    """
+    A streamed response for content that honours Range, and is cut off after
+    cut_off bytes if given, either cleanly or by raising reset_error.
+    """
+    def __init__(self, content, headers, cut_off=None, reset_error=None):
+        self.content = content
+        self.cut_off = cut_off
+        self.reset_error = reset_error
+        self.status_code = 200
+        self.headers = {}
+        offset = 0
+        if 'Range' in headers:
+            offset = int(headers['Range'].removeprefix("bytes=").removesuffix("-"))
+            self.status_code = 416 if offset >= len(content) else 206
+        self.body = content[offset:]
+        self.headers['Content-Length'] = str(len(self.body))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+    def raise_for_status(self):
+        pass
+
+
+    def iter_content(self, chunk_size):
+        body = self.body if self.cut_off is None else self.body[:self.cut_off]
+        for i in range(0, len(body), chunk_size):
+            yield body[i:i + chunk_size]
+        if self.cut_off is not None and self.reset_error is not None:
+            raise self.reset_error
+
+
+@patch('findshows.dump_cache.time.sleep')
+@patch('findshows.dump_cache.DOWNLOAD_CHUNK_BYTES', 4)
+class DumpCacheTests(TestCase):
+    content = b"0123456789" * 10
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dump_cache = DumpCache(directory.name, keep=2)
+        self.requests = []
+
+
+    def serve(self, cut_offs=(), reset_error=None):
+        """
+        Patches requests.get to serve self.content, cutting off the first
+        responses after cut_offs bytes (raising reset_error there, if given).
+        """
+        cut_offs = list(cut_offs)
+        def get(url, headers, **kwargs):
+            self.requests.append(headers)
+            return FakeResponse(self.content, headers, cut_offs.pop(0) if cut_offs else None, reset_error)
+        patcher = patch('findshows.dump_cache.requests.get', side_effect=get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+    def test_resumes_interrupted_download(self, *mocks):
+        self.serve(cut_offs=[30, 25])
+
+        path = self.dump_cache.fetch("https://test.com/dump.tar", "20261018", "dump.tar",
+                                     hashlib.sha256(self.content).hexdigest())
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(self.requests, [{}, {'Range': "bytes=30-"}, {'Range': "bytes=55-"}])
+        self.assertFalse(os.path.exists(f"{path}.part"))
+
+
+    def test_resumes_after_connection_reset(self, *mocks):
+        self.serve(cut_offs=[40], reset_error=requests.exceptions.ChunkedEncodingError("Connection reset by peer"))
+
+        path = self.dump_cache.fetch("https://test.com/dump.tar", "20261018", "dump.tar",
+                                     hashlib.sha256(self.content).hexdigest())
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(self.requests, [{}, {'Range': "bytes=40-"}])
+
+
+    def test_cached_file_not_downloaded_again(self, *mocks):
+        self.serve()
+        self.dump_cache.fetch("https://test.com/dump.tar", "20261018", "dump.tar")
+        self.dump_cache.fetch("https://test.com/dump.tar", "20261018", "dump.tar")
+
+        self.assertEqual(len(self.requests), 1)
+
+
+    def test_gives_up_after_retries(self, *mocks):
+        self.serve(cut_offs=[0] * (dump_cache.DOWNLOAD_RETRIES + 1))
+
+        with self.assertRaises(requests.ConnectionError):
+            self.dump_cache.fetch("https://test.com/dump.tar", "20261018", "dump.tar")
+
+        self.assertFalse(os.path.exists(self.dump_cache.path("20261018", "dump.tar")))
+
+
+    def test_checksum_mismatch(self, *mocks):
+        self.serve()
+
+        with self.assertRaises(ChecksumError):
+            self.dump_cache.fetch("https://test.com/dump.tar", "20261018", "dump.tar", "0" * 64)
+
+        path = self.dump_cache.path("20261018", "dump.tar")
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(f"{path}.part"))
+
+
+    def test_prune_keeps_newest(self, *mocks):
+        self.serve()
+        for dump_id in ("20261011", "20261018", "20261004"):
+            self.dump_cache.fetch("https://test.com/dump.tar", dump_id, "dump.tar")
+
+        self.dump_cache.prune()
+
+        self.assertEqual(sorted(os.listdir(self.dump_cache.directory)), ["20261011", "20261018"])
@@ -3,11 +3,15 @@ from smtplib import SMTPConnectError
 from unittest.mock import MagicMock, patch
 
 from django.core import mail
+from django.test import override_settings
+from django.utils.html import escape
 from django.tasks import TaskResultStatus
 from django.views.generic.dates import timezone_today
 
-from findshows.email import daily_mod_email, enqueue_concert_edit_reminder, invite_artist, send_simple_email, send_mass_html_mail, send_rec_email
-from findshows.models import ArtistVerificationStatus, ConcertTags
+from findshows import email
+from findshows.email import MailSenderPool, enqueue_rec_email_shards, daily_mod_email, enqueue_concert_edit_reminder, invite_artist, send_simple_email, send_mass_html_mail, send_rec_email
+from findshows.models import ArtistVerificationStatus, ConcertTags, WeeklySendDelivery, WeeklySendRun
+from findshows.pipeline import StageStats
 from findshows.tests.test_helpers import TestCaseHelpers
 
 
@@ -95,7 +99,62 @@ class SendMassHtmlMailTests(TestCaseHelpers):
         self.assertEqual(mock_logger.warning.call_count, 2)
 
 
+class MailSenderPoolTests(TestCaseHelpers):
+    def test_success(self):
+        stats = StageStats("Sent")
+        with MailSenderPool(3, 1000, stats) as sender_pool:
+            for i in range(5):
+                sender_pool.put(('subject', 'text', 'html', None, [f'test{i}@em.ail']))
+
+        self.assertEqual(stats.count, 5)
+        self.assert_equal_as_sets((f'test{i}@em.ail' for i in range(5)),
+                                  (msg.to[0] for msg in mail.outbox))
+
+
+    @patch('findshows.email.logger')
+    @patch('findshows.email.EmailMultiAlternatives')
+    def test_email_failure(self, MockEmail: MagicMock, mock_logger: MagicMock):
+        send = MagicMock(side_effect=SMTPConnectError(123, "error message"))
+        MockEmail.return_value = MagicMock(send=send)
+        stats = StageStats("Sent")
+        with MailSenderPool(2, 1000, stats) as sender_pool:
+            sender_pool.put(('subject', 'text', 'html', None, ['test@em.ail']))
+            sender_pool.put(('subject2', 'text2', 'html2', None, ['test2@em.ail']))
+
+        self.assertEqual(send.call_count, 2)
+        self.assertEqual(stats.count, 0)
+        self.assertEqual(mock_logger.warning.call_count, 2)
+
+
+class LoadFollowedArtistIdsTests(TestCaseHelpers):
+    def test_single_query(self):
+        artist1, artist2 = self.create_artist(), self.create_artist()
+        user_profiles = [self.create_user_profile(followed_artists=[artist1, artist2]),
+                         self.create_user_profile(followed_artists=[artist2]),
+                         self.create_user_profile()]
+
+        with self.assertNumQueries(1):
+            email._load_followed_artist_ids(user_profiles)
+
+        self.assert_equal_as_sets([artist1.pk, artist2.pk], user_profiles[0].followed_artist_ids)
+        self.assertEqual(user_profiles[1].followed_artist_ids, [artist2.pk])
+        self.assertEqual(user_profiles[2].followed_artist_ids, [])
+
+
 class SendRecEmailTests(TestCaseHelpers):
+    @override_settings(WEEKLY_EMAIL_CHUNK_SIZE=2, WEEKLY_EMAIL_RENDER_WORKERS=3,
+                       WEEKLY_EMAIL_SENDER_THREADS=3, WEEKLY_EMAIL_MAX_PER_SECOND=1000)
+    def test_pipeline_sends_every_chunk(self):
+        self.create_concert(timezone_today() + timedelta(1))
+        emails = [f"user{i}@em.ail" for i in range(5)]
+        for email_address in emails:
+            self.create_user_profile(email=email_address)
+
+        self.assertEqual(send_rec_email(), 5)
+        self.assert_emails_sent(5)
+        self.assert_equal_as_sets(emails, (msg.to[0] for msg in mail.outbox))
+
+
     def test_temp_artist_filtering(self):
         non_temp_artist = self.get_static_instance(self.StaticArtists.LOCAL_ARTIST)
         temp_artist = self.get_static_instance(self.StaticArtists.TEMP_ARTIST)
@@ -160,6 +219,218 @@ class SendRecEmailTests(TestCaseHelpers):
         self.assert_concert_link_in_message_html(declined_concert, mail.outbox[0], True)
 
 
+    def test_resumed_run_skips_delivered_recipients(self):
+        concert = self.create_concert(timezone_today() + timedelta(1))
+        user1 = self.create_user_profile(email="user1@em.ail")
+        self.create_user_profile(email="user2@em.ail")
+        self.create_user_profile(email="user3@em.ail")
+        run = WeeklySendRun.objects.create(date=timezone_today())
+        WeeklySendDelivery.objects.create(run=run, user_profile=user1)
+
+        self.assertEqual(send_rec_email(), 2)
+        self.assert_equal_as_sets(("user2@em.ail", "user3@em.ail"), (msg.to[0] for msg in mail.outbox))
+        self.assertEqual(run.deliveries.count(), 3)
+        run.refresh_from_db()
+        self.assertIsNotNone(run.finished_at)
+        concert.refresh_from_db()
+        self.assertEqual(concert.shared, timezone_today())
+
+
+    def test_failed_send_retried(self):
+        concert = self.create_concert(timezone_today() + timedelta(1))
+        emails = [f"user{i}@em.ail" for i in range(3)]
+        for email_address in emails:
+            self.create_user_profile(email=email_address)
+
+        send = email.EmailMultiAlternatives.send
+        def fail_for_user1(message, *args, **kwargs):
+            if message.to == ["user1@em.ail"]:
+                raise SMTPConnectError(123, "error message")
+            return send(message, *args, **kwargs)
+        with patch('findshows.email.EmailMultiAlternatives.send', autospec=True, side_effect=fail_for_user1):
+            self.assertEqual(send_rec_email(), 2)
+
+        # The run stays open until everybody has been sent to
+        concert.refresh_from_db()
+        self.assertIsNone(concert.shared)
+        self.assertIsNone(WeeklySendRun.objects.get().finished_at)
+
+        mail.outbox = []
+        self.assertEqual(send_rec_email(), 1)
+        self.assertEqual([msg.to for msg in mail.outbox], [["user1@em.ail"]])
+        self.assertIsNotNone(WeeklySendRun.objects.get().finished_at)
+        concert.refresh_from_db()
+        self.assertEqual(concert.shared, timezone_today())
+
+
+    def test_finished_run_not_resent(self):
+        self.create_concert(timezone_today() + timedelta(1))
+        self.create_user_profile(email="user1@em.ail")
+        send_rec_email()
+        self.assertEqual(send_rec_email(), 0)
+        self.assert_emails_sent(1)
+
+
+    @override_settings(WEEKLY_EMAIL_CHUNK_SIZE=1)
+    def test_interrupted_run(self):
+        concert = self.create_concert(timezone_today() + timedelta(1))
+        emails = [f"user{i}@em.ail" for i in range(4)]
+        # Different tags so that each user gets their own render
+        tags = [[ConcertTags.ORIGINALS], [ConcertTags.COVERS], [ConcertTags.DJ], [ConcertTags.ORIGINALS, ConcertTags.COVERS]]
+        for email_address, preferred_concert_tags in zip(emails, tags):
+            self.create_user_profile(email=email_address, preferred_concert_tags=preferred_concert_tags)
+
+        one_rec_email = email._one_rec_email
+        def fail_for_user2(user_profile, *args, **kwargs):
+            if user_profile.user.email == "user2@em.ail":
+                raise ValueError
+            return one_rec_email(user_profile, *args, **kwargs)
+        with patch('findshows.email._one_rec_email', side_effect=fail_for_user2):
+            self.assertRaises(ValueError, send_rec_email)
+
+        # Share dates wait for the whole run
+        concert.refresh_from_db()
+        self.assertIsNone(concert.shared)
+        self.assertIsNone(WeeklySendRun.objects.get().finished_at)
+
+        send_rec_email()
+        recipients = [msg.to[0] for msg in mail.outbox]
+        self.assertCountEqual(emails, recipients)
+        concert.refresh_from_db()
+        self.assertEqual(concert.shared, timezone_today())
+
+
+    def test_identical_inputs_rendered_once(self):
+        self.create_concert(timezone_today() + timedelta(1))
+        self.create_concert(timezone_today() + timedelta(2))
+        for i in range(3):
+            self.create_user_profile(email=f"user{i}@em.ail")
+        self.create_user_profile(email="tags@em.ail", preferred_concert_tags=[ConcertTags.DJ])
+
+        with patch('findshows.email._one_rec_email', wraps=email._one_rec_email) as one_rec_email:
+            send_rec_email()
+
+        self.assertEqual(one_rec_email.call_count, 2)
+        self.assert_emails_sent(4)
+        html = {msg.to[0]: msg.alternatives[0][0] for msg in mail.outbox}
+        self.assertEqual(html["user0@em.ail"], html["user1@em.ail"])
+        self.assertEqual(html["user0@em.ail"], html["user2@em.ail"])
+
+
+    def test_shared_layout_compiled_once(self):
+        originals = self.create_concert(timezone_today() + timedelta(1), tags=[ConcertTags.ORIGINALS])
+        dj = self.create_concert(timezone_today() + timedelta(2), tags=[ConcertTags.DJ])
+        self.create_user_profile(email="originals@em.ail", preferred_concert_tags=[ConcertTags.ORIGINALS])
+        self.create_user_profile(email="dj@em.ail", preferred_concert_tags=[ConcertTags.DJ])
+
+        with patch('findshows.email.render_email_to_string', wraps=email.render_email_to_string) as render:
+            send_rec_email()
+
+        self.assertEqual(render.call_count, 1)
+        self.assert_emails_sent(2)
+        for message in mail.outbox:
+            match message.recipients():
+                case ["originals@em.ail"]:
+                    self.assert_concert_link_in_message_html(originals, message)
+                    self.assert_concert_link_in_message_html(dj, message, True)
+                case ["dj@em.ail"]:
+                    self.assert_concert_link_in_message_html(dj, message)
+                    self.assert_concert_link_in_message_html(originals, message, True)
+            self.assertNotIn("mjmlph", message.alternatives[0][0])
+
+
+    def test_poster_captions(self):
+        described = self.create_concert(timezone_today() + timedelta(1), artists=[self.create_artist("Band A")])
+        described.description = "Album release"
+        described.save()
+        plain = self.create_concert(timezone_today() + timedelta(2), artists=[self.create_artist("Band B")])
+        self.create_user_profile(email="user1@em.ail")
+
+        send_rec_email()
+
+        html = mail.outbox[0].alternatives[0][0]
+        self.assertIn(escape(f"{described.display_str()} | Album release"), html)
+        self.assertIn(escape(plain.display_str()), html)
+        self.assertIn(f'alt="{escape(str(plain))}"', html)
+        self.assertNotIn("bound method", html)
+
+
+    @override_settings(WEEKLY_EMAIL_SHARD_SIZE=2)
+    def test_sharded_send(self):
+        concert = self.create_concert(timezone_today() + timedelta(1))
+        emails = [f"user{i}@em.ail" for i in range(5)]
+        for email_address in emails:
+            self.create_user_profile(email=email_address)
+
+        self.assertEqual(enqueue_rec_email_shards(), 3)
+
+        # Tasks run immediately in tests
+        self.assertCountEqual(emails, (msg.to[0] for msg in mail.outbox))
+        run = WeeklySendRun.objects.get()
+        self.assertEqual((run.recipient_count, run.shard_count, run.shards_finished), (5, 3, 3))
+        self.assertIsNotNone(run.finished_at)
+        concert.refresh_from_db()
+        self.assertEqual(concert.shared, timezone_today())
+        self.assertEqual(enqueue_rec_email_shards(), 0)
+
+
+    @override_settings(WEEKLY_EMAIL_SHARD_SIZE=2)
+    def test_sharded_send_keeps_its_concerts(self):
+        concert = self.create_concert(timezone_today() + timedelta(1))
+        for i in range(3):
+            self.create_user_profile(email=f"user{i}@em.ail")
+
+        # A concert listed while the shards are going out isn't sent or marked shared
+        send_rec_emails = email._send_rec_emails
+        late_concerts = []
+        def list_concert_first(*args, **kwargs):
+            if not late_concerts:
+                late_concerts.append(self.create_concert(timezone_today() + timedelta(2)))
+            return send_rec_emails(*args, **kwargs)
+        with patch('findshows.email._send_rec_emails', side_effect=list_concert_first):
+            enqueue_rec_email_shards()
+
+        self.assert_emails_sent(3)
+        for message in mail.outbox:
+            self.assert_concert_link_in_message_html(late_concerts[0], message, True)
+        concert.refresh_from_db()
+        late_concerts[0].refresh_from_db()
+        self.assertEqual(concert.shared, timezone_today())
+        self.assertIsNone(late_concerts[0].shared)
+
+
+    @override_settings(WEEKLY_EMAIL_SHARD_SIZE=2)
+    @patch('findshows.email.logger')
+    def test_failed_shard_reported(self, mock_logger: MagicMock):
+        concert = self.create_concert(timezone_today() + timedelta(1))
+        for i in range(3):
+            self.create_user_profile(email=f"user{i}@em.ail")
+
+        send_rec_emails = email._send_rec_emails
+        shards_started = []
+        def fail_first_shard(*args, **kwargs):
+            shards_started.append(True)
+            if len(shards_started) == 1:
+                raise ValueError
+            return send_rec_emails(*args, **kwargs)
+        with patch('findshows.email._send_rec_emails', side_effect=fail_first_shard):
+            enqueue_rec_email_shards()
+
+        self.assert_emails_sent(1)
+        run = WeeklySendRun.objects.get()
+        self.assertEqual((run.shard_count, run.shards_finished), (2, 2))
+        self.assertIsNone(run.finished_at)
+        mock_logger.error.assert_called_once()
+        concert.refresh_from_db()
+        self.assertIsNone(concert.shared)
+
+        # Rerunning sends the failed shard's recipients and finishes the run
+        self.assertEqual(enqueue_rec_email_shards(), 1)
+        self.assert_emails_sent(3)
+        concert.refresh_from_db()
+        self.assertEqual(concert.shared, timezone_today())
+
+
     def test_no_concerts_no_email(self):
         self.create_user_profile(email="user1@em.ail")
         send_rec_email()
@@ -7,6 +7,7 @@ import tempfile
 from django.contrib.auth import get_user_model
 from django.contrib.staticfiles.testing import StaticLiveServerTestCase
 from django.core import mail
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase, override_settings, tag
 from django.urls import reverse
@@ -20,7 +21,7 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.wait import WebDriverWait
 
 from findshows.email import local_url_to_email
-from findshows.models import Ages, Artist, ArtistLinkingInfo, Concert, ConcertTags, Contact, EmailVerification, ListenLink, MusicBrainzArtist, SetOrder, UserProfile, Venue, YoutubeLink
+from findshows.models import Ages, Artist, ArtistLinkingInfo, Concert, ConcertTags, Contact, EmailVerification, ListenLink, MusicBrainzArtist, MusicBrainzSimilarity, SetOrder, UserProfile, Venue, YoutubeLink
 
 User = get_user_model()
 
@@ -286,6 +287,9 @@ class MixinForAllTestCases():
 
         SetOrder.objects.bulk_create(SetOrder(artist=artist, concert=concert, order_number=idx)
                                      for idx, artist in enumerate(artists))
+        # bulk_create skips the signals that keep is_public up to date
+        Concert.objects.filter(pk=concert.pk).update_is_public()
+        concert.refresh_from_db(fields=['is_public'])
 
         return concert
 
@@ -300,10 +304,12 @@ class MixinForAllTestCases():
         # dict counts as populated, as that's a possible return value from
         # the API and we store None otherwise.
         tomorrow = now() + datetime.timedelta(1)
-        return MusicBrainzArtist.objects.create(mbid=mbid,
-                                                name=name,
-                                                similar_artists=similar_artists or {},
-                                                similar_artists_cache_datetime=tomorrow)
+        mb_artist = MusicBrainzArtist.objects.create(mbid=mbid,
+                                                     name=name,
+                                                     similar_artists_cache_datetime=tomorrow)
+        MusicBrainzSimilarity.objects.bulk_create(MusicBrainzSimilarity(source=mb_artist, target_mbid=target_mbid, score=score)
+                                                  for target_mbid, score in (similar_artists or {}).items())
+        return mb_artist
 
     @classmethod
     def create_artist_linking_info(cls, email=None, artist=None, created_by=None, generated_datetime=None, pk=None):
@@ -353,6 +359,14 @@ class MixinForAllTestCases():
 class TestCaseHelpers(TestCase, MixinForAllTestCases):
     fixtures = ["findshows/test-fixture.json"]
 
+    @classmethod
+    def _fixture_setup(cls):
+        # The database is rolled back between tests but the cache isn't. Cleared
+        # here rather than in setUp so that subclasses' setUps needn't call super().
+        cache.clear()
+        super()._fixture_setup()
+
+
     def login_static_user(self, static_user: MixinForAllTestCases.StaticUsers) -> UserProfile:
         # must match order of users in fixture
         emails_list = (
@@ -392,6 +406,29 @@ class TestCaseHelpers(TestCase, MixinForAllTestCases):
             self.assertIn(needle, haystack)
 
 
+    def assert_num_queries_with_concerts(self, num_queries, url, params=None, artists=(), **concert_kwargs):
+        """
+        Fails unless getting url takes exactly num_queries queries both with one
+        concert (i.e. concert card) on it and with four. artists are added to each
+        concert's bill.
+        """
+        def add_concert():
+            mb_artist = self.create_musicbrainz_artist(str(uuid4()), similar_artists={'123': .5})
+            # Created yesterday to stay out of the mod daily digest's artist table
+            new_artists = [self.create_artist(similar_musicbrainz_artists=[mb_artist],
+                                              created_at=timezone_today() - datetime.timedelta(1))
+                           for _ in range(2)]
+            self.create_concert(artists=[*artists, *new_artists], **concert_kwargs)
+
+        add_concert()
+        with self.assertNumQueries(num_queries):
+            self.client.get(url, params)
+        for _ in range(3):
+            add_concert()
+        with self.assertNumQueries(num_queries):
+            self.client.get(url, params)
+
+
     def assert_concert_order(self, message, ordered_concerts=list(), unordered_concerts=list(), excluded_concerts=list()):
         haystack = message.alternatives[0][0]
         for concert in chain(ordered_concerts, unordered_concerts, excluded_concerts):
@@ -0,0 +1,36 @@
+from unittest.mock import MagicMock
+
+from findshows import mjml_layouts
+from findshows.tests.test_helpers import TestCaseHelpers
+
+
+def paragraphs_context(values):
+    return lambda placeholders: {'paragraphs': [placeholders(value) for value in values]}
+
+
+class MjmlLayoutsTests(TestCaseHelpers):
+    def test_compiles_each_layout_once(self):
+        render_fallback = MagicMock(side_effect=lambda template_name, context:
+                                    "".join(f"<p>{p}</p>" for p in context['paragraphs']))
+
+        html1 = mjml_layouts.render('email.html', 2, paragraphs_context(['one', 'two']), render_fallback)
+        html2 = mjml_layouts.render('email.html', 2, paragraphs_context(['three', '<b>four</b>']), render_fallback)
+        html3 = mjml_layouts.render('email.html', 1, paragraphs_context(['five']), render_fallback)
+
+        self.assertEqual(render_fallback.call_count, 2)
+        self.assertEqual(html1, "<p>one</p><p>two</p>")
+        self.assertEqual(html2, "<p>three</p><p>&lt;b&gt;four&lt;/b&gt;</p>")
+        self.assertEqual(html3, "<p>five</p>")
+
+
+    def test_falls_back_when_token_is_lost(self):
+        # e.g. MJML dropping a value it doesn't like
+        render_fallback = MagicMock(side_effect=lambda template_name, context:
+                                    f"<p>{context['paragraphs'][0]}</p>")
+
+        html1 = mjml_layouts.render('email.html', 2, paragraphs_context(['one', 'two']), render_fallback)
+        html2 = mjml_layouts.render('email.html', 2, paragraphs_context(['three', 'four']), render_fallback)
+
+        self.assertEqual(render_fallback.call_count, 3)
+        self.assertEqual(html1, "<p>one</p>")
+        self.assertEqual(html2, "<p>three</p>")
@@ -0,0 +1,69 @@
+from django.views.generic.dates import timezone_today
+
+from findshows import mod_digest
+from findshows.models import ArtistVerificationStatus
+from findshows.tests.test_helpers import TestCaseHelpers
+
+
+class ModDigestTests(TestCaseHelpers):
+    def add_records(self):
+        user_profile = self.create_user_profile(artist_verification_status=ArtistVerificationStatus.UNVERIFIED)
+        artist = self.create_artist(created_at=timezone_today())
+        user_profile.managed_artists.add(artist)
+        self.create_artist_linking_info(artist=artist)
+        self.create_venue(created_at=timezone_today(), is_verified=False)
+        self.create_concert(artists=[artist, self.create_artist()], created_at=timezone_today())
+        self.create_contact()
+
+
+    def test_num_queries(self):
+        def build_and_display():
+            digest = mod_digest.build(timezone_today())
+            # What the daily mod email and mod dashboard templates look up
+            for artist in digest['new_artists']:
+                list(artist.artistlinkinginfo_set.all())
+                [str(user_profile.user) for user_profile in artist.managing_users.all()]
+            for user_profile in digest['unverified_user_profiles']:
+                str(user_profile)
+                list(user_profile.managed_artists.all())
+            for concert in digest['new_concerts']:
+                str(concert)
+                concert.conflicts
+
+        # New artists with their linking infos and managers' profiles and users (4),
+        # unverified profiles with their artists (2), new and unverified venues (2),
+        # new concerts with their card data (4) and conflicts (3), and contacts
+        for _ in range(4):
+            self.add_records()
+            with self.assertNumQueries(16):
+                build_and_display()
+
+
+    def test_cached(self):
+        self.add_records()
+        mod_digest.get(timezone_today())
+        with self.assertNumQueries(0):
+            digest = mod_digest.get(timezone_today())
+        self.assertEqual(len(digest['new_concerts']), 1)
+
+
+    def test_invalidated_on_write(self):
+        digest = mod_digest.get(timezone_today())
+        self.assertEqual(digest['new_artists'], [])
+
+        artist = self.create_artist(created_at=timezone_today())
+        self.assertEqual(mod_digest.get(timezone_today())['new_artists'], [artist])
+
+        user_profile = self.create_user_profile(artist_verification_status=ArtistVerificationStatus.UNVERIFIED)
+        self.assertEqual(mod_digest.get(timezone_today())['unverified_user_profiles'], [user_profile])
+        user_profile.artist_verification_status = ArtistVerificationStatus.VERIFIED
+        user_profile.save()
+        self.assertEqual(mod_digest.get(timezone_today())['unverified_user_profiles'], [])
+
+
+    def test_not_invalidated_on_login(self):
+        self.add_records()
+        mod_digest.get(timezone_today())
+        self.login_static_user(self.StaticUsers.NON_ARTIST)
+        with self.assertNumQueries(0):
+            mod_digest.get(timezone_today())
@@ -0,0 +1,42 @@
+from findshows.models import ArtistRelevance
+from findshows.tests.test_helpers import TestCaseHelpers
+
+
+class ArtistRelevanceTests(TestCaseHelpers):
+    def assert_relevances(self, artist, expected):
+        relevances = {r.mbid: r.score for r in ArtistRelevance.objects.filter(artist=artist)}
+        self.assertEqual(relevances.keys(), expected.keys())
+        for mbid, score in expected.items():
+            self.assertAlmostEqual(relevances[mbid], score)
+
+    def test_matches_similarity_score(self):
+        self.create_musicbrainz_artist('123', 'mb 123' , {'999': .2, '888': .5})
+        self.create_musicbrainz_artist('456', 'mb 456' , {'999': .4, '777': .8})
+        artist = self.create_artist(similar_musicbrainz_artists=['123', '456'])
+        self.assert_relevances(artist, {'123': .5, '456': .5, '999': .3, '888': .25, '777': .4})
+        for mbid in ('123', '456', '999', '888', '777', '000'):
+            self.assertAlmostEqual(artist.similarity_score([mbid]),
+                                   ArtistRelevance.objects.filter(artist=artist, mbid=mbid).values_list('score', flat=True).first() or 0)
+
+    def test_no_similar_artists(self):
+        artist = self.create_artist()
+        self.assert_relevances(artist, {})
+
+    def test_similar_artists_changed(self):
+        self.create_musicbrainz_artist('123', 'mb 123' , {'999': .2})
+        self.create_musicbrainz_artist('456', 'mb 456' , {'888': .4})
+        artist = self.create_artist(similar_musicbrainz_artists=['123'])
+        self.assert_relevances(artist, {'123': 1, '999': .2})
+
+        artist.similar_musicbrainz_artists.set(['456'])
+        self.assert_relevances(artist, {'456': 1, '888': .4})
+
+        artist.similar_musicbrainz_artists.clear()
+        self.assert_relevances(artist, {})
+
+    def test_musicbrainz_artist_updated(self):
+        mb_artist = self.create_musicbrainz_artist('123', 'mb 123' , {'999': .2})
+        artist = self.create_artist(similar_musicbrainz_artists=['123'])
+
+        mb_artist.set_similar_artists({'888': .6})
+        self.assert_relevances(artist, {'123': 1, '888': .6})
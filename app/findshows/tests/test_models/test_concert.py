@@ -1,6 +1,6 @@
 import datetime
 from django.views.generic.dates import timezone_today
-from findshows.models import Ages
+from findshows.models import Ages, ArtistVerificationStatus, Concert
 
 from findshows.tests.test_helpers import TestCaseHelpers
 
@@ -42,3 +42,79 @@ class ConcertTests(TestCaseHelpers):
         concert2 = self.create_concert(date=tomorrow, venue=venue)
         self.assert_equal_as_sets([concert1], concert2.conflicts)
         self.assert_equal_as_sets([concert2], concert1.conflicts)
+
+    def test_with_relevance(self):
+        self.create_musicbrainz_artist('123', 'mb 123' , {'999': .2, '888': .5})
+        self.create_musicbrainz_artist('456', 'mb 456' , {'999': .4, '777': .8})
+        self.create_musicbrainz_artist('789', 'mb 789' , {'888': .7})
+
+        artist1 = self.create_artist(similar_musicbrainz_artists=['123'])
+        artist2 = self.create_artist(similar_musicbrainz_artists=['456', '789'])
+        artist3 = self.create_artist()
+
+        concert1 = self.create_concert(artists=[artist1, artist2, artist3])
+        concert2 = self.create_concert(artists=[artist3])
+
+        for mbids in (['999', '888'], ['123'], ['000'], []):
+            concerts = Concert.objects.with_relevance(mbids)
+            self.assertAlmostEqual(concerts.get(pk=concert1.pk).relevance, concert1.relevance_score(mbids))
+            self.assertEqual(concerts.get(pk=concert2.pk).relevance, 0)
+
+    def test_is_public_follows_inputs(self):
+        artist = self.create_artist()
+        venue = self.create_venue(is_verified=True, declined_listing=False)
+        creator = self.create_user_profile(artist_verification_status=ArtistVerificationStatus.VERIFIED)
+        concert = self.create_concert(artists=[artist], venue=venue, created_by=creator)
+        def assert_public(expected):
+            self.assertEqual(Concert.publically_visible().filter(pk=concert.pk).exists(), expected)
+
+        assert_public(True)
+
+        artist.is_temp_artist = True
+        artist.save()
+        assert_public(False)
+        artist.is_temp_artist = False
+        artist.save()
+        assert_public(True)
+
+        venue.declined_listing = True
+        venue.save()
+        assert_public(False)
+        venue.declined_listing = False
+        venue.save()
+        assert_public(True)
+
+        creator.artist_verification_status = ArtistVerificationStatus.DEVERIFIED
+        creator.save()
+        assert_public(False)
+        creator.artist_verification_status = ArtistVerificationStatus.INVITED
+        creator.save()
+        assert_public(True)
+
+        concert.cancelled = True
+        concert.save()
+        assert_public(False)
+        concert.cancelled = False
+        concert.save()
+        assert_public(True)
+
+        temp_artist = self.get_static_instance(self.StaticArtists.TEMP_ARTIST)
+        concert.artists.add(temp_artist, through_defaults={'order_number': 1})
+        assert_public(False)
+        concert.artists.remove(temp_artist)
+        assert_public(True)
+
+    def test_with_followed_count(self):
+        followed1, followed2, not_followed = self.create_artist(), self.create_artist(), self.create_artist()
+        user_profile = self.create_user_profile(followed_artists=[followed1, followed2])
+        other_user_profile = self.create_user_profile(followed_artists=[not_followed])
+
+        concert1 = self.create_concert(artists=[followed1, followed2, not_followed])
+        concert2 = self.create_concert(artists=[not_followed, followed2])
+        concert3 = self.create_concert(artists=[not_followed])
+
+        # Only user_profile's follows count, not other_user_profile's
+        counts = dict(Concert.objects.with_followed_count(user_profile).values_list('pk', 'followed_count'))
+        self.assertEqual(counts, {concert1.pk: 2, concert2.pk: 1, concert3.pk: 0})
+        counts = dict(Concert.objects.with_followed_count(other_user_profile).values_list('pk', 'followed_count'))
+        self.assertEqual(counts, {concert1.pk: 1, concert2.pk: 1, concert3.pk: 1})
@@ -1,12 +1,21 @@
 from datetime import timedelta
 from unittest.mock import patch, MagicMock
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.utils.timezone import now
 from django.conf import settings
-from findshows.models import MusicBrainzArtist
+from findshows.models import MusicBrainzArtist, MusicBrainzSimilarity
+
+# Beyond the cache period for any artist, and within it for any artist, respectively
+STALE_DELTA = timedelta(settings.LISTENBRAINZ_SIMILAR_ARTIST_CACHE_DAYS + settings.LISTENBRAINZ_SIMILAR_ARTIST_CACHE_JITTER_DAYS, hours=1)
+FRESH_DELTA = timedelta(settings.LISTENBRAINZ_SIMILAR_ARTIST_CACHE_DAYS - settings.LISTENBRAINZ_SIMILAR_ARTIST_CACHE_JITTER_DAYS, hours=-1)
+
 
 class GetSimilarArtistsTests(TestCase):
+    def setUp(self):
+        cache.clear() # Refresh locks aren't rolled back with the database
+
     @patch('findshows.musicbrainz.get_similar_artists')
     def test_caching(self, mock: MagicMock):
         mb_artist = MusicBrainzArtist.objects.create(mbid='123', name='Test Artist')
@@ -19,13 +28,14 @@ class GetSimilarArtistsTests(TestCase):
         self.assertEqual(mb_artist.get_similar_artists(), {'456': .3, '789': .8})
         self.assertEqual(mock.call_count, 1)
 
+        # The tests use the immediate task backend, so the refresh is done before returning
         mock.return_value = {'2468': .7}
-        mb_artist.similar_artists_cache_datetime = now() - timedelta(settings.LISTENBRAINZ_SIMILAR_ARTIST_CACHE_DAYS, hours=1)
+        mb_artist.similar_artists_cache_datetime = now() - STALE_DELTA
         self.assertEqual(mb_artist.get_similar_artists(), {'2468': .7})
         self.assertEqual(mock.call_count, 2)
 
         mock.return_value = {'293857': .6}
-        mb_artist.similar_artists_cache_datetime = now() - timedelta(settings.LISTENBRAINZ_SIMILAR_ARTIST_CACHE_DAYS, hours=-1)
+        mb_artist.similar_artists_cache_datetime = now() - FRESH_DELTA
         self.assertEqual(mb_artist.get_similar_artists(), {'2468': .7})
         self.assertEqual(mock.call_count, 2)
 
@@ -33,6 +43,44 @@ class GetSimilarArtistsTests(TestCase):
         self.assertEqual(mb_artist.get_similar_artists(), {'2468': .7})
 
 
+    @patch('django.tasks.base.Task.enqueue')
+    @patch('findshows.musicbrainz.get_similar_artists', return_value={'456': .3})
+    def test_stale_data_served_while_refreshing(self, api_mock: MagicMock, enqueue_mock: MagicMock):
+        mb_artist = MusicBrainzArtist.objects.create(mbid='123', name='Test Artist')
+        mb_artist.set_similar_artists({'789': .8})
+        mb_artist.similar_artists_cache_datetime = now() - STALE_DELTA
+        mb_artist.save()
+
+        self.assertEqual(mb_artist.get_similar_artists(), {'789': .8})
+        self.assertEqual(api_mock.call_count, 0)
+        enqueue_mock.assert_called_once_with('123')
+
+        # Single flight: another stale read doesn't queue another refresh
+        self.assertEqual(MusicBrainzArtist.objects.get(mbid='123').get_similar_artists(), {'789': .8})
+        self.assertEqual(enqueue_mock.call_count, 1)
+
+
+    @patch('findshows.musicbrainz.get_similar_artists', return_value=None)
+    def test_failed_refresh_backs_off(self, mock: MagicMock):
+        mb_artist = MusicBrainzArtist.objects.create(mbid='123', name='Test Artist')
+        mb_artist.set_similar_artists({'789': .8})
+        mb_artist.similar_artists_cache_datetime = now() - STALE_DELTA
+        mb_artist.save()
+
+        self.assertEqual(mb_artist.get_similar_artists(), {'789': .8})
+        self.assertEqual(mb_artist.get_similar_artists(), {'789': .8})
+        self.assertEqual(mock.call_count, 1)
+
+
+    def test_cache_days_jittered(self):
+        days = [MusicBrainzArtist(mbid=str(i)).similar_artists_cache_days() for i in range(100)]
+        self.assertGreater(len(set(days)), 50)
+        for d in days:
+            self.assertLessEqual(abs(d - settings.LISTENBRAINZ_SIMILAR_ARTIST_CACHE_DAYS),
+                                 settings.LISTENBRAINZ_SIMILAR_ARTIST_CACHE_JITTER_DAYS)
+        self.assertEqual(MusicBrainzArtist(mbid='1').similar_artists_cache_days(), days[1])
+
+
 class SimilarityScoreTests(TestCase):
     @patch('findshows.musicbrainz.get_similar_artists', return_value = {'456': .3, '789': .8})
     def test_self_score_is_1(self, mock: MagicMock):
@@ -53,3 +101,28 @@ class SimilarityScoreTests(TestCase):
     def test_API_failed(self, mock: MagicMock):
         mb_artist = MusicBrainzArtist.objects.create(mbid='123', name='Test Artist')
         self.assertEqual(mb_artist.similarity_score('2468'), 0)
+
+
+class SimilarityStorageTests(TestCase):
+    def setUp(self):
+        cache.clear() # Refresh locks aren't rolled back with the database
+
+    @patch('findshows.musicbrainz.get_similar_artists', return_value = {'456': .3, '789': .8, '123': 1})
+    def test_similarities_stored_as_rows(self, mock: MagicMock):
+        mb_artist = MusicBrainzArtist.objects.create(mbid='123', name='Test Artist')
+        mb_artist.get_similar_artists()
+        self.assertEqual(set(MusicBrainzSimilarity.objects.filter(source=mb_artist).values_list('target_mbid', 'score')),
+                         {('456', .3), ('789', .8)}) # no self-similarity row
+
+    @patch('findshows.musicbrainz.get_similar_artists', return_value = {'456': .3})
+    def test_refresh_replaces_rows(self, mock: MagicMock):
+        mb_artist = MusicBrainzArtist.objects.create(mbid='123', name='Test Artist')
+        mb_artist.set_similar_artists({'789': .8, '246': .1})
+        mb_artist.similar_artists_cache_datetime = now() - STALE_DELTA
+        self.assertEqual(mb_artist.get_similar_artists(), {'456': .3})
+        self.assertEqual(MusicBrainzSimilarity.objects.filter(source=mb_artist).count(), 1)
+
+    @patch('findshows.musicbrainz.get_similar_artists', return_value = None)
+    def test_never_fetched(self, mock: MagicMock):
+        mb_artist = MusicBrainzArtist.objects.create(mbid='123', name='Test Artist')
+        self.assertIsNone(mb_artist.get_similar_artists())
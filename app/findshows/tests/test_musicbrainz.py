@@ -1,4 +1,5 @@
 from unittest.mock import patch, MagicMock
+import requests
 
 from django.test import TestCase
 
@@ -61,3 +62,53 @@ class GetSimilarArtistTests(TestCase):
 
         self.assertEqual(musicbrainz.get_similar_artists('999'), {})
         request_mock.assert_called_once()
+
+
+    @patch('findshows.musicbrainz.logger')
+    def test_request_failure(self, logger_mock: MagicMock, request_mock: MagicMock):
+        request_mock.side_effect = requests.Timeout("too slow")
+
+        self.assertEqual(musicbrainz.get_similar_artists('999'), None)
+        logger_mock.error.assert_called_once_with("MusicBrainz API for finding similar artists failed: too slow")
+
+
+@patch('findshows.musicbrainz.requests.get')
+class GetSimilarArtistsBatchTests(TestCase):
+    def test_expected_response(self, request_mock: MagicMock):
+        response = MagicMock()
+        response.status_code = 200
+        response.json = MagicMock(return_value=[
+            {'artist_mbid': '123', 'score': 100, 'reference_mbid': 'aaa'},
+            {'artist_mbid': '456', 'score': 70, 'reference_mbid': 'aaa'},
+            {'artist_mbid': '123', 'score': 40, 'reference_mbid': 'bbb'},
+            {'artist_mbid': '789', 'score': 10, 'reference_mbid': 'bbb'},
+        ])
+        request_mock.return_value = response
+
+        self.assertEqual(musicbrainz.get_similar_artists_batch(['aaa', 'bbb', 'ccc']),
+                         {'aaa': {'123': 1, '456': .7},
+                          'bbb': {'123': 1, '789': .25},
+                          'ccc': {}})
+        request_mock.assert_called_once()
+        self.assertEqual(request_mock.call_args.args[1]['artist_mbids'], 'aaa,bbb,ccc')
+
+
+    @patch('findshows.musicbrainz.logger')
+    def test_bad_status_code(self, logger_mock: MagicMock, request_mock: MagicMock):
+        response = MagicMock()
+        response.status_code = 500
+        request_mock.return_value = response
+
+        self.assertEqual(musicbrainz.get_similar_artists_batch(['aaa', 'bbb']), None)
+        logger_mock.error.assert_called_once_with("MusicBrainz API for finding similar artists returned status code 500.")
+
+
+    @patch('findshows.musicbrainz.logger')
+    def test_missing_reference_mbid(self, logger_mock: MagicMock, request_mock: MagicMock):
+        response = MagicMock()
+        response.status_code = 200
+        response.json = MagicMock(return_value=[{'artist_mbid': '123', 'score': 100}])
+        request_mock.return_value = response
+
+        self.assertEqual(musicbrainz.get_similar_artists_batch(['aaa', 'bbb']), None)
+        logger_mock.error.assert_called_once_with("MusicBrainz API for finding similar artists returned unexpected JSON.")
@@ -0,0 +1,62 @@
+import io
+import json
+from unittest.mock import patch
+from uuid import uuid4
+
+from django.test import TestCase
+
+from findshows import musicbrainz_dump
+
+
+def artist_dump(mbids):
+    return io.BytesIO(b"".join(json.dumps({'id': mbid, 'name': f"Artist {mbid}", 'disambiguation': None,
+                                           'aliases': []}).encode() + b"\n"
+                               for mbid in mbids))
+
+
+def listen_stats(*listeners_top_artists):
+    """artists_all_time.jsonl with a line for each listener's list of top artists"""
+    return io.BytesIO(b"".join(json.dumps({'data': [{'artist_mbid': mbid} for mbid in mbids]}).encode() + b"\n"
+                               for mbids in listeners_top_artists))
+
+
+@patch('findshows.musicbrainz_dump.STATS_CHUNK_LINES', 2)
+class CountListenersTests(TestCase):
+    def test_threshold(self):
+        popular, middling, obscure = (str(uuid4()) for _ in range(3))
+        stats = listen_stats([popular, middling], [popular], [popular, obscure, "not-a-uuid"], [middling, popular], [])
+
+        eligible = musicbrainz_dump.count_listeners(stats, min_listeners=2)
+
+        self.assertEqual(len(eligible), 2)
+        self.assertIn(popular, eligible)
+        self.assertIn(middling, eligible)
+        self.assertNotIn(obscure, eligible)
+        self.assertEqual(list(eligible.contains([obscure, popular, "not-a-uuid"])), [False, True, False])
+
+
+@patch('findshows.musicbrainz_dump.CHUNK_LINES', 3)
+class ParseArtistDumpTests(TestCase):
+    def test_filters_in_order(self):
+        mbids = [str(uuid4()) for _ in range(20)]
+        eligible = musicbrainz_dump.count_listeners(listen_stats(mbids[::2]), min_listeners=1)
+
+        chunks = list(musicbrainz_dump.parse_artist_dump(artist_dump(mbids), eligible, workers=2))
+
+        self.assertEqual(sum(lines for lines, _ in chunks), 20)
+        self.assertEqual([artist for _, artists in chunks for artist in artists],
+                         [(mbid, f"Artist {mbid}", None, musicbrainz_dump.content_hash(f"Artist {mbid}", None))
+                          for mbid in mbids[::2]])
+
+
+    def test_parse_error_raised(self):
+        eligible = musicbrainz_dump.count_listeners(listen_stats(), min_listeners=1)
+        with self.assertRaises(json.JSONDecodeError):
+            list(musicbrainz_dump.parse_artist_dump(io.BytesIO(b'{"id": \n'), eligible, workers=2))
+
+
+class ContentHashTests(TestCase):
+    def test_distinguishes_fields(self):
+        self.assertEqual(musicbrainz_dump.content_hash("a", "b"), musicbrainz_dump.content_hash("a", "b"))
+        self.assertNotEqual(musicbrainz_dump.content_hash("a", "b"), musicbrainz_dump.content_hash("ab", None))
+        self.assertNotEqual(musicbrainz_dump.content_hash("a", None), musicbrainz_dump.content_hash("a", ""))
@@ -0,0 +1,49 @@
+from findshows.models import MusicBrainzArtist
+from findshows.musicbrainz_dump import content_hash
+from findshows.musicbrainz_loaders import CopyLoader, OrmLoader
+from findshows.tests.test_helpers import TestCaseHelpers
+
+
+def dump_row(mbid, name, disambiguation=None):
+    return (mbid, name, disambiguation, content_hash(name, disambiguation))
+
+
+class LoaderTestMixin:
+    loader_class = None
+
+    def load(self, *batches, full=False):
+        with self.loader_class(full=full) as loader:
+            for batch in batches:
+                loader.load(batch)
+            return loader.finish()
+
+
+    def test_only_writes_changes(self):
+        self.load([dump_row('unchanged', 'Same name'), dump_row('changed', 'Old name')])
+
+        counts = self.load([dump_row('unchanged', 'Same name'), dump_row('changed', 'New name', "the\tother one")],
+                           [dump_row('new', 'Back\\slash')])
+
+        self.assertEqual(counts, {'inserted': 1, 'updated': 1, 'unchanged': 1})
+        changed = MusicBrainzArtist.objects.get(mbid='changed')
+        self.assertEqual((changed.name, changed.disambiguation), ('New name', "the\tother one"))
+        self.assertEqual(changed.content_hash, content_hash('New name', "the\tother one"))
+        self.assertEqual(MusicBrainzArtist.objects.get(mbid='new').name, 'Back\\slash')
+
+
+    def test_full_compares_fields(self):
+        self.load([dump_row('edited', 'Name')])
+        # e.g. edited by hand without updating the hash
+        MusicBrainzArtist.objects.filter(mbid='edited').update(name='Wrong name')
+
+        self.assertEqual(self.load([dump_row('edited', 'Name')]), {'inserted': 0, 'updated': 0, 'unchanged': 1})
+        self.assertEqual(self.load([dump_row('edited', 'Name')], full=True), {'inserted': 0, 'updated': 1, 'unchanged': 0})
+        self.assertEqual(MusicBrainzArtist.objects.get(mbid='edited').name, 'Name')
+
+
+class OrmLoaderTests(LoaderTestMixin, TestCaseHelpers):
+    loader_class = OrmLoader
+
+
+class CopyLoaderTests(LoaderTestMixin, TestCaseHelpers):
+    loader_class = CopyLoader
@@ -0,0 +1,143 @@
+import asyncio
+import socket
+from smtplib import SMTPRecipientsRefused
+
+from aiosmtpd.controller import Controller
+from django.core.mail import EmailMessage
+from django.test import override_settings
+
+from findshows.pooled_smtp import EmailBackend
+from findshows.email import MailSenderPool, send_mass_html_mail
+from findshows.pipeline import StageStats
+from findshows.tests.test_helpers import TestCaseHelpers
+
+
+class RecordingHandler:
+    """aiosmtpd handler standing in for the SMTP relay."""
+    def __init__(self, transient_failures=0):
+        self.envelopes = []
+        self.peers = set()
+        self.transient_failures = transient_failures
+
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.endswith("@refused.invalid"):
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+
+    async def handle_DATA(self, server, session, envelope):
+        self.peers.add(session.peer)
+        if self.transient_failures:
+            self.transient_failures -= 1
+            return "421 Try again later"
+        self.envelopes.append(envelope)
+        return "250 OK"
+
+
+class PooledSMTPBackendTests(TestCaseHelpers):
+    def start_server(self, handler):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        controller = Controller(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        self.addCleanup(controller.stop)
+        return port
+
+
+    def backend(self, port, **kwargs):
+        backend = EmailBackend(host="127.0.0.1", port=port, **kwargs)
+        self.addCleanup(backend.close)
+        return backend
+
+
+    def messages(self, *recipients):
+        return [EmailMessage("Subject", "Body", "from@test.com", [recipient]) for recipient in recipients]
+
+
+    def test_sends_over_pool(self):
+        handler = RecordingHandler()
+        backend = self.backend(self.start_server(handler), pool_size=3)
+
+        recipients = [f"user{i}@test.com" for i in range(10)]
+        results = backend.send_messages_with_results(self.messages(*recipients))
+
+        self.assertEqual(results, [None] * 10)
+        self.assert_equal_as_sets(recipients, (envelope.rcpt_tos[0] for envelope in handler.envelopes))
+        self.assertLessEqual(len(handler.peers), 3)
+
+
+    def test_reports_each_result(self):
+        handler = RecordingHandler()
+        backend = self.backend(self.start_server(handler), pool_size=2)
+
+        results = backend.send_messages_with_results(self.messages("a@test.com", "b@refused.invalid", "c@test.com"))
+
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], SMTPRecipientsRefused)
+        self.assertIsNone(results[2])
+        self.assertEqual(len(handler.envelopes), 2)
+
+
+    def test_reconnects_after_transient_error(self):
+        handler = RecordingHandler(transient_failures=1)
+        backend = self.backend(self.start_server(handler), pool_size=1)
+
+        results = backend.send_messages_with_results(self.messages("a@test.com", "b@test.com"))
+
+        self.assertEqual(results, [None, None])
+        self.assertEqual(len(handler.envelopes), 2)
+        self.assertEqual(len(handler.peers), 2) # The failed connection was replaced
+
+
+    def test_gives_up_after_retries(self):
+        handler = RecordingHandler(transient_failures=5)
+        backend = self.backend(self.start_server(handler), pool_size=1, retries=2)
+
+        results = backend.send_messages_with_results(self.messages("a@test.com"))
+
+        self.assertEqual(results[0].smtp_code, 421)
+        self.assertEqual(handler.transient_failures, 2)
+
+
+    def test_inside_running_event_loop(self):
+        handler = RecordingHandler()
+        backend = self.backend(self.start_server(handler), pool_size=2)
+
+        async def send_from_async_code():
+            return backend.send_messages_with_results(self.messages("a@test.com", "b@test.com"))
+
+        self.assertEqual(asyncio.run(send_from_async_code()), [None, None])
+        self.assertEqual(len(handler.envelopes), 2)
+
+
+    def test_send_mass_html_mail(self):
+        handler = RecordingHandler()
+        port = self.start_server(handler)
+        datatuples = [("Subject", "Text", "<p>HTML</p>", None, [recipient])
+                      for recipient in ("a@test.com", "b@refused.invalid", "c@test.com")]
+
+        with override_settings(EMAIL_BACKEND="findshows.pooled_smtp.EmailBackend", EMAIL_HOST="127.0.0.1", EMAIL_PORT=port):
+            sent = send_mass_html_mail(datatuples)
+
+        self.assertEqual(sent, 2)
+        self.assertEqual(len(handler.envelopes), 2)
+
+
+    def test_mail_sender_pool(self):
+        handler = RecordingHandler()
+        port = self.start_server(handler)
+        recipients = ["a@test.com", "b@refused.invalid", "c@test.com", "d@test.com", "e@test.com"]
+        stats = StageStats("Sent")
+
+        with override_settings(EMAIL_BACKEND="findshows.pooled_smtp.EmailBackend", EMAIL_HOST="127.0.0.1", EMAIL_PORT=port,
+                               EMAIL_POOL_SIZE=2):
+            with MailSenderPool(1, 1000, stats) as sender_pool:
+                for recipient in recipients:
+                    sender_pool.put(("Subject", "Text", "<p>HTML</p>", None, [recipient]), recipient)
+
+        self.assertEqual(stats.count, 4)
+        self.assert_equal_as_sets(sender_pool.pop_delivered(), [r for r in recipients if r != "b@refused.invalid"])
+        self.assertLessEqual(len(handler.peers), 2)
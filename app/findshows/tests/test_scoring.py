@@ -0,0 +1,52 @@
+from findshows.models import Concert
+from findshows.scoring import ConcertRelevanceIndex
+from findshows.tests.test_helpers import TestCaseHelpers
+
+
+class ConcertRelevanceIndexTests(TestCaseHelpers):
+    def test_matches_relevance_score(self):
+        self.create_musicbrainz_artist('123', 'mb 123' , {'999': .2, '888': .5})
+        self.create_musicbrainz_artist('456', 'mb 456' , {'999': .4, '777': .8})
+        self.create_musicbrainz_artist('789', 'mb 789' , {'888': .7})
+
+        artist1 = self.create_artist(similar_musicbrainz_artists=['123'])
+        artist2 = self.create_artist(similar_musicbrainz_artists=['456', '789'])
+        artist3 = self.create_artist()
+
+        concert1 = self.create_concert(artists=[artist1, artist2, artist3])
+        concert2 = self.create_concert(artists=[artist2])
+        concert3 = self.create_concert(artists=[artist3])
+
+        concerts = list(Concert.objects.with_card_data(searched_mbids=None)) # relevance_score needs every similarity
+        index = ConcertRelevanceIndex(concerts)
+        for mbids in (['999', '888'], ['123'], ['777', '456', '000'], ['000']):
+            scores = index.scores(mbids)
+            for concert in concerts:
+                self.assertAlmostEqual(scores.get(concert.pk, 0), concert.relevance_score(mbids))
+        # Concerts with a relevance of 0 are left out
+        self.assertEqual(index.scores(['999', '888']).keys(), {concert1.pk, concert2.pk})
+        self.assertEqual(index.scores(['777']).keys(), {concert1.pk, concert2.pk})
+        self.assertNotIn(concert3.pk, index.scores(['123']))
+
+
+    def test_single_query(self):
+        self.create_musicbrainz_artist('123', 'mb 123' , {'999': .2})
+        concerts = [self.create_concert(artists=[self.create_artist(similar_musicbrainz_artists=['123'])])
+                    for _ in range(3)]
+        concerts = list(Concert.objects.with_card_data())
+        with self.assertNumQueries(1):
+            index = ConcertRelevanceIndex(concerts)
+        with self.assertNumQueries(0):
+            index.scores(['999'])
+
+
+    def test_restricted_mbids(self):
+        self.create_musicbrainz_artist('123', 'mb 123' , {'999': .2, '888': .5})
+        artist = self.create_artist(similar_musicbrainz_artists=['123'])
+        self.create_concert(artists=[artist])
+        concerts = list(Concert.objects.with_card_data(searched_mbids=None))
+
+        full_index = ConcertRelevanceIndex(concerts)
+        index = ConcertRelevanceIndex(concerts, ['999', '000'])
+        self.assertEqual(set(index.columns), {'999'})
+        self.assertEqual(index.scores(['999', '000']), full_index.scores(['999', '000']))
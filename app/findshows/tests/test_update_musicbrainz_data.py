@@ -0,0 +1,62 @@
+import io
+import json
+import os
+import tarfile
+import tempfile
+from uuid import uuid4
+
+from django.core.management import call_command
+from django.test import override_settings
+
+from findshows.models import MusicBrainzArtist, MusicBrainzImport
+from findshows.tests.test_helpers import TestCaseHelpers
+
+
+def add_to_tar(path, mode, member_path, content):
+    with tarfile.open(path, mode) as tar:
+        member = tarfile.TarInfo(member_path)
+        member.size = len(content)
+        tar.addfile(member, io.BytesIO(content))
+
+
+@override_settings(MIN_LISTENERS_TO_IMPORT_MB=2)
+class UpdateMusicBrainzDataFromDirTests(TestCaseHelpers):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dump_dir = os.path.join(directory.name, "20261018-001001")
+        os.mkdir(self.dump_dir)
+
+        self.popular, self.obscure = str(uuid4()), str(uuid4())
+        stats = [{'data': [{'artist_mbid': self.popular}, {'artist_mbid': self.obscure}]},
+                 {'data': [{'artist_mbid': self.popular}]}]
+        stats_folder = "listenbrainz-statistics-dump-20261015-000000"
+        add_to_tar(os.path.join(self.dump_dir, f"{stats_folder}.tar.gz"), "w:gz",
+                   f"{stats_folder}/lbdump/statistics/artists_all_time.jsonl",
+                   b"".join(json.dumps(line).encode() + b"\n" for line in stats))
+        artists = [{'id': mbid, 'name': name, 'disambiguation': ""}
+                   for mbid, name in ((self.popular, "Popular"), (self.obscure, "Obscure"))]
+        add_to_tar(os.path.join(self.dump_dir, "artist.tar.xz"), "w:xz", "mbdump/artist",
+                   b"".join(json.dumps(artist).encode() + b"\n" for artist in artists))
+
+
+    def import_dumps(self, **options):
+        call_command("update_musicbrainz_data", from_dir=self.dump_dir, workers=1, stdout=io.StringIO(), **options)
+
+
+    def test_imports_eligible_artists(self):
+        self.import_dumps()
+
+        self.assert_equal_as_sets(MusicBrainzArtist.objects.values_list('mbid', 'name'), [(self.popular, "Popular")])
+        self.assertEqual(MusicBrainzImport.last_dump_id(), "20261018-001001")
+
+
+    def test_skips_imported_dump(self):
+        self.import_dumps()
+        MusicBrainzArtist.objects.all().delete()
+
+        self.import_dumps()
+        self.assertFalse(MusicBrainzArtist.objects.exists())
+
+        self.import_dumps(full=True)
+        self.assertTrue(MusicBrainzArtist.objects.filter(mbid=self.popular).exists())
@@ -73,6 +73,12 @@ class ArtistDashboardTests(TestCaseHelpers):
         self.assertNotIn(reverse('findshows:create_concert'), str(response.content))
 
 
+    def test_num_queries(self):
+        self.login_static_user(self.StaticUsers.LOCAL_ARTIST)
+        self.assert_num_queries_with_concerts(14, reverse("findshows:artist_dashboard"),
+                                              artists=[self.get_static_instance(self.StaticArtists.LOCAL_ARTIST)])
+
+
 
 class ViewArtistTests(TestCaseHelpers):
     def test_anonymous_view(self):
@@ -115,6 +121,12 @@ class ViewArtistTests(TestCaseHelpers):
         self.assert_equal_as_sets(response.context['upcoming_concerts'], [concert12today, concert12future])
 
 
+    def test_num_queries(self):
+        artist = self.get_static_instance(self.StaticArtists.LOCAL_ARTIST)
+        self.assert_num_queries_with_concerts(11, reverse("findshows:view_artist", args=(artist.pk,)),
+                                              artists=[artist])
+
+
     def test_temp_artist_can_only_be_viewed_by_artist(self):
         response = self.client.get(reverse("findshows:view_artist", args=(self.StaticArtists.TEMP_ARTIST.value,)))
         self.assertTemplateUsed(response, 'findshows/pages/view_artist_hidden.html')
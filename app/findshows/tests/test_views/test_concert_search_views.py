@@ -1,8 +1,9 @@
 from datetime import timedelta
+from django.test import override_settings
 from django.urls import reverse
 from django.views.generic.dates import timezone_today
 from findshows.forms import ShowFinderForm
-from findshows.models import ArtistVerificationStatus, ConcertTags, MusicBrainzArtist
+from findshows.models import ArtistVerificationStatus, Concert, ConcertTags, MusicBrainzArtist
 from findshows.tests.test_helpers import TestCaseHelpers, concert_GET_params
 
 
@@ -153,4 +154,138 @@ class ConcertSearchResultsTests(TestCaseHelpers):
         self.assert_equal_as_sets(response.context['concerts'], [concert1, concert6])
 
 
+    def test_num_queries(self):
+        self.create_musicbrainz_artist('123')
+        # Searched artists, then the concerts with their card data (4) and the searched artists' similarities
+        self.assert_num_queries_with_concerts(6, reverse('findshows:concert_search'),
+                                              concert_GET_params(musicbrainz_artists=['123']))
+
+
+    def test_logged_in_num_queries(self):
+        user_profile = self.login_static_user(self.StaticUsers.NON_ARTIST)
+        followed_artist = self.create_artist()
+        user_profile.followed_artists.add(followed_artist)
+        self.create_musicbrainz_artist('123')
+        # Session, user and profile, followed artists, then as for anonymous users
+        self.assert_num_queries_with_concerts(10, reverse('findshows:concert_search'),
+                                              concert_GET_params(musicbrainz_artists=['123'], sort_followed_to_top=True),
+                                              artists=[followed_artist])
+
+
     # Similarity sorting is tested in ../test_recommendations.py
+
+
+@override_settings(CONCERT_SEARCH_PAGE_SIZE=2)
+class ConcertSearchPaginationTests(TestCaseHelpers):
+    def get_all_pages(self, get_params):
+        pages = []
+        cursor = None
+        while True:
+            response = self.client.get(reverse('findshows:concert_search'),
+                                       {**get_params, 'cursor': cursor} if cursor else get_params)
+            pages.append(response.context['concerts'])
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                return pages
+
+
+    def test_pages_cover_all_results_once(self):
+        concerts = [self.create_concert() for _ in range(5)]
+        pages = self.get_all_pages(concert_GET_params())
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        all_results = [c for page in pages for c in page]
+        self.assertEqual(len(all_results), len(set(all_results)))
+        self.assert_equal_as_sets(all_results, concerts)
+
+
+    def test_pages_respect_relevance(self):
+        self.create_musicbrainz_artist('123', 'mb 123')
+        self.create_musicbrainz_artist('456', 'mb 456', {'123': .5})
+        relevant = self.create_concert(artists=[self.create_artist(similar_musicbrainz_artists=['123'])])
+        somewhat_relevant = self.create_concert(artists=[self.create_artist(similar_musicbrainz_artists=['456'])])
+        others = [self.create_concert() for _ in range(3)]
+
+        pages = self.get_all_pages(concert_GET_params(musicbrainz_artists=['123']))
+        all_results = [c for page in pages for c in page]
+        self.assertEqual(all_results[:2], [relevant, somewhat_relevant])
+        self.assert_equal_as_sets(all_results[2:], others)
+
+
+    def test_pages_with_tied_relevance(self):
+        self.create_musicbrainz_artist('123', 'mb 123')
+        for mbid, score in (('1', .1), ('2', .2), ('3', .3)):
+            self.create_musicbrainz_artist(mbid, f"mb {mbid}", {'123': score})
+        # Every bill's relevance is a sum of the same three floats, which has to come out
+        # exactly the same on each page for the cursor to pick up where it left off
+        concerts = [self.create_concert(artists=[self.create_artist(similar_musicbrainz_artists=[mbid])
+                                                 for mbid in ('1', '2', '3')])
+                    for _ in range(4)]
+
+        pages = self.get_all_pages(concert_GET_params(musicbrainz_artists=['123']))
+        self.assertEqual([len(page) for page in pages], [2, 2])
+        all_results = [c for page in pages for c in page]
+        self.assertEqual(len(all_results), len(set(all_results)))
+        self.assert_equal_as_sets(all_results, concerts)
+
+
+    def test_first_page_only_for_bad_cursor(self):
+        concerts = [self.create_concert() for _ in range(3)]
+        response = self.client.get(reverse('findshows:concert_search'),
+                                   {**concert_GET_params(), 'cursor': 'not-a-cursor'})
+        self.assertEqual(len(response.context['concerts']), 2)
+        self.assertIsNotNone(response.context['next_cursor'])
+
+
+class ConcertSearchCacheTests(TestCaseHelpers):
+    def search(self):
+        return self.client.get(reverse('findshows:concert_search'), concert_GET_params()).context['concerts']
+
+
+    def test_anonymous_results_cached(self):
+        concert = self.create_concert()
+        self.assertEqual(self.search(), [concert])
+        # update() skips signals, so the cached result should still be used
+        Concert.objects.filter(pk=concert.pk).update(cancelled=True)
+        Concert.objects.filter(pk=concert.pk).update_is_public()
+        self.assertEqual(self.search(), [concert])
+
+
+    def test_logged_in_results_not_cached(self):
+        self.login_static_user(self.StaticUsers.NON_ARTIST)
+        concert = self.create_concert()
+        self.assertEqual(self.search(), [concert])
+        Concert.objects.filter(pk=concert.pk).update(cancelled=True)
+        Concert.objects.filter(pk=concert.pk).update_is_public()
+        self.assertEqual(self.search(), [])
+
+
+    def test_concert_save_invalidates(self):
+        concert = self.create_concert()
+        self.assertEqual(self.search(), [concert])
+        concert.cancelled = True
+        concert.save()
+        self.assertEqual(self.search(), [])
+
+
+    def test_venue_save_invalidates(self):
+        concert = self.create_concert()
+        self.assertEqual(self.search(), [concert])
+        concert.venue.declined_listing = True
+        concert.venue.save()
+        self.assertEqual(self.search(), [])
+
+
+    def test_new_concert_invalidates(self):
+        concert1 = self.create_concert()
+        self.assertEqual(self.search(), [concert1])
+        concert2 = self.create_concert()
+        self.assert_equal_as_sets(self.search(), [concert1, concert2])
+
+
+    def test_verification_status_change_invalidates(self):
+        creator = self.create_user_profile(artist_verification_status=ArtistVerificationStatus.VERIFIED)
+        concert = self.create_concert(created_by=creator)
+        self.assertEqual(self.search(), [concert])
+        creator.artist_verification_status = ArtistVerificationStatus.DEVERIFIED
+        creator.save()
+        self.assertEqual(self.search(), [])
@@ -8,7 +8,7 @@ from django.utils.timezone import now
 from django.views.generic.dates import timezone_today
 
 from findshows.forms import CustomTextFormSet
-from findshows.models import ArtistVerificationStatus, Contact, CustomText, CustomTextTypes
+from findshows.models import ArtistVerificationStatus, Contact, CustomText, CustomTextTypes, WeeklySendDelivery, WeeklySendRun
 from findshows.tests.test_helpers import TestCaseHelpers
 
 
@@ -36,6 +36,9 @@ class ModDailyDigestTests(ModTestCaseHelpers):
         response = self.client.get(reverse("findshows:mod_daily_digest"), {'date': yesterday.isoformat()})
         self.assertIn(artist, response.context['artists'])
 
+    def test_num_queries(self):
+        self.assert_num_queries_with_concerts(14, reverse("findshows:mod_daily_digest"))
+
 
 class ModQueueTests(ModTestCaseHelpers):
     def test_filters_records(self):
@@ -63,6 +66,19 @@ class ModOutstandingInviteTests(ModTestCaseHelpers):
                                   [ali])
 
 
+class ModWeeklyEmailTests(ModTestCaseHelpers):
+    def test_progress(self):
+        user_profiles = [self.create_user_profile() for _ in range(3)]
+        run = WeeklySendRun.objects.create(date=timezone_today(), recipient_count=3, shard_count=2, shards_finished=1)
+        for user_profile in user_profiles[:2]:
+            WeeklySendDelivery.objects.create(run=run, user_profile=user_profile)
+
+        response = self.client.get(reverse("findshows:mod_weekly_email"))
+        self.assertEqual([r.delivered for r in response.context['runs']], [2])
+        self.assertContains(response, "2 of 3")
+        self.assertContains(response, "In progress")
+
+
 class TextCustomizationTests(ModTestCaseHelpers):
     def post_data(self):
         num_texts = len(CustomTextTypes.values)
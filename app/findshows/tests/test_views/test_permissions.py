@@ -53,6 +53,7 @@ MOD_URLS_NO_PK = (
     "mod_queue",
     "mod_outstanding_invites",
     "mod_text_customization",
+    "mod_weekly_email",
 )
 MOD_URLS_WITH_PK = (
     "venue_verification",
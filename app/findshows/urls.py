@@ -35,6 +35,7 @@ urlpatterns = [
     path("htmx/mod_queue", views.mod_queue, name="mod_queue"),
     path("htmx/mod_outstanding_invites", views.mod_outstanding_invites, name="mod_outstanding_invites"),
     path("htmx/mod_text_customization", views.mod_text_customization, name="mod_text_customization"),
+    path("htmx/mod_weekly_email", views.mod_weekly_email, name="mod_weekly_email"),
     path("htmx/venue_verification/<int:pk>", views.venue_verification, name="venue_verification"),
     path("htmx/artist_verification/<int:pk>", views.artist_verification_buttons, name="artist_verification_buttons"),
     path("htmx/resend_invite/<int:pk>", views.resend_invite, name="resend_invite"),
@@ -2,10 +2,11 @@ from datetime import timedelta
 from operator import and_, or_
 from functools import reduce
 import json
-from random import random, shuffle
+import secrets
 from pymemcache.client.base import Client
 
 from django.contrib.auth import login
+from django.core import signing
 from django.core.exceptions import PermissionDenied
 from django.db import IntegrityError
 from django.urls import NoReverseMatch, reverse
@@ -13,15 +14,16 @@ from django.http import HttpResponse, QueryDict
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.postgres.search import TrigramSimilarity
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.utils import timezone
 from django.views.generic.dates import timezone_today
 from django.conf import settings
 
+from findshows import mod_digest, search_cache
 from findshows.email import enqueue_concert_edit_reminder, invite_artist, invite_user_to_artist, notify_artist_verified, send_verify_email
 from findshows.widgets import ArtistAccessWidget
 
-from .models import Artist, ArtistLinkingInfo, ArtistVerificationStatus, Concert, ConcertTags, Contact, EmailCodeError, EmailVerification, JPEGImageException, MusicBrainzArtist, User, UserProfile, Venue
+from .models import Artist, ArtistLinkingInfo, ArtistVerificationStatus, Concert, ConcertTags, Contact, EmailCodeError, EmailVerification, JPEGImageException, MusicBrainzArtist, User, UserProfile, Venue, WeeklySendRun
 from .forms import ArtistAccessForm, ArtistEditForm, ConcertForm, ContactForm, CustomTextFormSet, ModDailyDigestForm, ShowFinderForm, TempArtistForm, UserCreationFormE, UserProfileForm, VenueForm
 
 
@@ -166,9 +168,9 @@ def resend_email_verification(request):
 @user_passes_test(User.can_see_artist_dashboard)
 def artist_dashboard(request):
     artists=request.user.userprofile.managed_artists.all()
-    # Remove duplicates in case user manages multiple artists on same bill
-    concerts = set(c for a in artists for c in a.concert_set.filter(date__gte=timezone_today()))
-    concerts = sorted(concerts, key = lambda c: c.date)
+    # distinct in case user manages multiple artists on same bill
+    concerts = Concert.objects.filter(artists__in=artists, date__gte=timezone_today()).distinct().order_by('date')
+    concerts = Concert.load_conflicts(concerts.with_card_data())
     outstanding_invites = ArtistLinkingInfo.objects.filter(created_by=request.user.userprofile)
 
     return render(request, "findshows/pages/artist_dashboard.html", context = {
@@ -192,7 +194,7 @@ def view_artist(request, pk):
             return render(request, "findshows/pages/view_artist_hidden.html")
 
     upcoming_concerts = Concert.objects.all() if (can_edit or User.is_mod_or_admin(request.user)) else Concert.publically_visible()
-    upcoming_concerts = upcoming_concerts.filter(date__gte=timezone.now(), artists=artist)
+    upcoming_concerts = upcoming_concerts.filter(date__gte=timezone.now(), artists=artist).with_card_data()
 
     return render(request, "findshows/pages/view_artist.html", context={
         'artist': artist,
@@ -633,7 +635,7 @@ def musicbrainz_artist_search_results(request):
         return HttpResponse("")
 
     q = request.GET['mb_search']
-    mb_artists = MusicBrainzArtist.objects.defer('similar_artists', 'similar_artists_cache_datetime')
+    mb_artists = MusicBrainzArtist.objects.defer('similar_artists_cache_datetime')
     mb_artists = mb_artists.annotate(similarity=TrigramSimilarity('name', q)
                                      ).filter(name__fuzzy_index=q).order_by('-similarity')[:10]
 
@@ -673,6 +675,9 @@ def concert_search(request):
     else:
         search_form = ShowFinderForm()
 
+    # Loaded once for all of the concert cards' follow buttons
+    followed_artists = list(request.user.userprofile.followed_artists.all()) if request.user.is_authenticated else []
+
     if search_form.is_valid():
         concerts = Concert.publically_visible()
         if search_form.cleaned_data['is_date_range']:
@@ -685,44 +690,128 @@ def concert_search(request):
             concerts = concerts.filter(reduce(or_, (Q(tags__icontains=t) for t in search_form.cleaned_data['concert_tags'])))
 
         searched_musicbrainz_artists = search_form.cleaned_data.get('musicbrainz_artists', [])
-        concerts = list(concerts)
         searched_mbids = [mb_artist.mbid for mb_artist in search_form.cleaned_data['musicbrainz_artists']]
+        concerts = concerts.with_card_data(searched_mbids)
+        ordering = []
+        if request.user.is_authenticated and search_form.cleaned_data['sort_followed_to_top']:
+            concerts = concerts.with_followed_count(request.user.userprofile)
+            ordering.append(('followed_count', True))
         if searched_mbids:
-            concerts = sorted(concerts,
-                              key=lambda c: (c.relevance_score(searched_mbids), random()),
-                              reverse=True)
+            concerts = concerts.with_relevance(searched_mbids)
+            ordering.append(('relevance', True))
+
+        # The seed keeps the random tiebreak stable across pages. Logged out
+        # visitors share a daily seed so their results can be cached.
+        cursor = _load_search_cursor(request.GET.get('cursor'))
+        if cursor:
+            seed = cursor['seed']
+        elif request.user.is_authenticated:
+            seed = secrets.token_hex(8)
         else:
-            shuffle(concerts)
-
-        if request.user.is_authenticated and search_form.cleaned_data['sort_followed_to_top']:
-            followed_artists = set(request.user.userprofile.followed_artists.all())
-            concerts = sorted(concerts,
-                              key=lambda c: len(followed_artists.intersection(c.artists.all())),
-                              reverse=True)
+            seed = timezone_today().isoformat()
+        concerts = concerts.with_shuffle_key(seed)
+        ordering.extend((('shuffle_key', False), ('pk', False)))
 
+        if request.user.is_authenticated:
+            concerts, next_cursor = _concert_search_page(concerts, ordering, seed, cursor)
+        else:
+            concerts, next_cursor = _cached_concert_search_page(concerts, ordering, seed, cursor,
+                                                                search_form.cleaned_data)
 
         search_form = ShowFinderForm(initial=search_form.cleaned_data)
 
     else:
         concerts = []
         searched_musicbrainz_artists = []
+        cursor = next_cursor = None
 
     response = render(request, "findshows/partials/concert_search.html#results", context={
         "concerts": concerts,
         "search_form": search_form,
         "searched_musicbrainz_artists": searched_musicbrainz_artists,
+        "followed_artists": followed_artists,
+        "is_first_page": cursor is None,
+        "next_cursor": next_cursor,
     })
-    headers = {
-        "concert-search-form-updates": {
-            "data": search_form.data or search_form.initial,
-            "errors": search_form.errors,
+    if cursor is None: # Later pages don't need to update the form
+        headers = {
+            "concert-search-form-updates": {
+                "data": search_form.data or search_form.initial,
+                "errors": search_form.errors,
+            }
         }
-    }
-    response.headers['HX-Trigger'] = json.dumps(headers, default=str)
+        response.headers['HX-Trigger'] = json.dumps(headers, default=str)
 
     return response
 
 
+CONCERT_SEARCH_CURSOR_SALT = "findshows.concert_search.cursor"
+
+
+def _load_search_cursor(raw_cursor):
+    if not raw_cursor:
+        return None
+    try:
+        cursor = signing.loads(raw_cursor, salt=CONCERT_SEARCH_CURSOR_SALT)
+    except signing.BadSignature:
+        return None
+    if not (isinstance(cursor, dict) and 'seed' in cursor and 'last' in cursor):
+        return None
+    return cursor
+
+
+def _concert_search_page(concerts, ordering, seed, cursor):
+    """
+    Keyset pagination over `ordering`, a list of (annotation/field name, descending)
+    that must end in a unique field. Returns a page of concerts and the cursor for
+    the next page (None if this is the last page).
+    """
+    if cursor:
+        if len(cursor['last']) != len(ordering):
+            return [], None # Search params changed underneath the cursor
+        after = None
+        for (name, descending), value in reversed(list(zip(ordering, cursor['last']))):
+            past_value = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+            after = past_value if after is None else past_value | (Q(**{name: value}) & after)
+        concerts = concerts.filter(after)
+
+    page_size = settings.CONCERT_SEARCH_PAGE_SIZE
+    concerts = list(concerts.order_by(*(f"{'-' if descending else ''}{name}" for name, descending in ordering))[:page_size + 1])
+    if len(concerts) <= page_size:
+        return concerts, None
+
+    concerts = concerts[:page_size]
+    next_cursor = signing.dumps({'seed': seed,
+                                 'last': [getattr(concerts[-1], name) for name, _ in ordering]},
+                                salt=CONCERT_SEARCH_CURSOR_SALT)
+    return concerts, next_cursor
+
+
+def _cached_concert_search_page(concerts, ordering, seed, cursor, cleaned_data):
+    """
+    _concert_search_page for searches that don't depend on who's searching.
+    Caches the concert IDs of each page until search_cache.bump_version is
+    called (see signals.py).
+    """
+    params = {
+        'date': cleaned_data['date'],
+        'end_date': cleaned_data['end_date'] if cleaned_data['is_date_range'] else None,
+        'concert_tags': sorted(cleaned_data['concert_tags']),
+        'mbids': sorted(mb_artist.mbid for mb_artist in cleaned_data['musicbrainz_artists']),
+        'seed': seed,
+        'last': cursor['last'] if cursor else None,
+    }
+    cached = search_cache.get_results(params)
+    if cached is None:
+        concerts, next_cursor = _concert_search_page(concerts, ordering, seed, cursor)
+        search_cache.set_results(params, ([concert.pk for concert in concerts], next_cursor))
+        return concerts, next_cursor
+
+    concert_ids, next_cursor = cached
+    concerts_by_id = Concert.objects.with_card_data(params['mbids']).in_bulk(concert_ids)
+    return [concerts_by_id[pk] for pk in concert_ids if pk in concerts_by_id], next_cursor
+
+
 #######################
 ## Moderator views  ###
 #######################
@@ -738,6 +827,7 @@ def mod_dashboard(request):
             {'name': 'dailyDigest', 'url_name': 'findshows:mod_daily_digest', 'label': 'Daily digest'},
             {'name': 'outstandingInvites', 'url_name': 'findshows:mod_outstanding_invites', 'label': 'Outstanding invites'},
             {'name': 'customTexts', 'url_name': 'findshows:mod_text_customization', 'label': 'Text customization'},
+            {'name': 'weeklyEmail', 'url_name': 'findshows:mod_weekly_email', 'label': 'Weekly email'},
         ]
     })
 
@@ -750,22 +840,25 @@ def mod_daily_digest(request):
         form = ModDailyDigestForm(initial={'date': timezone_today})
 
     date = form.cleaned_data['date'] if form.is_valid() else timezone_today()
+    digest = mod_digest.get(date)
 
     return render(request, "findshows/htmx/mod_daily_digest.html", context={
         'form': form,
-        'artists': Artist.objects.filter(created_at=date),
-        'concerts': Concert.objects.filter(created_at=date),
-        'venues': Venue.objects.filter(created_at=date),
+        'artists': digest['new_artists'],
+        'concerts': digest['new_concerts'],
+        'venues': digest['new_venues'],
         'show_conflicts': True,
     })
 
 
 @user_passes_test(User.is_mod_or_admin)
 def mod_queue(request):
+    # The unverified records and contacts are the same in every date's digest
+    digest = mod_digest.get(timezone_today())
     return render(request, "findshows/htmx/mod_queue.html", context={
-        'unverified_user_profiles': UserProfile.objects.filter(artist_verification_status=ArtistVerificationStatus.UNVERIFIED),
-        'venues': Venue.objects.filter(is_verified=False),
-        'contacts': Contact.objects.all(),
+        'unverified_user_profiles': digest['unverified_user_profiles'],
+        'venues': digest['unverified_venues'],
+        'contacts': digest['contacts'],
     })
 
 
@@ -776,6 +869,13 @@ def mod_outstanding_invites(request):
     })
 
 
+@user_passes_test(User.is_mod_or_admin)
+def mod_weekly_email(request):
+    return render(request, "findshows/htmx/mod_weekly_email.html", context={
+        'runs': WeeklySendRun.objects.annotate(delivered=Count('deliveries')).order_by('-date')[:5],
+    })
+
+
 @user_passes_test(User.is_mod_or_admin)
 def mod_text_customization(request):
     saved = False
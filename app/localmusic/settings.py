@@ -174,6 +174,9 @@ USER_AGENT_HEADER=os.getenv("USER_AGENT_HEADER")
 # This must be at least 14, since that's how often the dataset updates. Higher
 # to minimize API calls and be a responsible consumer of their data.
 LISTENBRAINZ_SIMILAR_ARTIST_CACHE_DAYS=30
+# Each artist's cache period is offset by up to this many days either way (fixed per
+# artist) so that artists fetched together don't all expire together.
+LISTENBRAINZ_SIMILAR_ARTIST_CACHE_JITTER_DAYS=3
 
 # Memcache
 MEMCACHE_LOCATION = os.getenv("CACHE_LOCATION")
@@ -205,14 +208,22 @@ match os.getenv("EMAIL_BACKEND", "SMTP"):
     case "FILEBASED":
         EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
         EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'emails')
-    case "SMTP":
-        EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+    case "SMTP" | "POOLED_SMTP" as email_backend:
+        EMAIL_BACKEND = {
+            "SMTP": "django.core.mail.backends.smtp.EmailBackend",
+            # Sends batches of messages concurrently over a threaded pool of connections
+            "POOLED_SMTP": "findshows.pooled_smtp.EmailBackend",
+        }[email_backend]
         EMAIL_HOST = os.getenv("EMAIL_HOST")
         EMAIL_PORT = os.getenv("EMAIL_PORT")
         EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
         EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
     case _:
         EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
+# For POOLED_SMTP: connections per batch of messages, and how many times a message
+# is retried over a new connection after a transient failure
+EMAIL_POOL_SIZE = int(os.getenv("EMAIL_POOL_SIZE", '4'))
+EMAIL_SEND_RETRIES = int(os.getenv("EMAIL_SEND_RETRIES", '2'))
 
 SERVER_EMAIL=os.getenv("SERVER_EMAIL", "root@localhost")
 DEFAULT_FROM_EMAIL=os.getenv("DEFAULT_FROM_EMAIL", "webmaster@localhost")
@@ -232,6 +243,9 @@ if IS_DEV:
 
 # Misc
 MAX_DATE_RANGE = int(os.getenv("MAX_DATE_RANGE", '7'))
+CONCERT_SEARCH_PAGE_SIZE = int(os.getenv("CONCERT_SEARCH_PAGE_SIZE", '10'))
+CONCERT_SEARCH_CACHE_SECONDS = int(os.getenv("CONCERT_SEARCH_CACHE_SECONDS", '3600'))
+MOD_DIGEST_CACHE_SECONDS = int(os.getenv("MOD_DIGEST_CACHE_SECONDS", '3600'))
 MAX_DAILY_CONCERT_CREATES = int(os.getenv("MAX_DAILY_CONCERT_CREATES", '20'))
 MAX_DAILY_VENUE_CREATES = int(os.getenv("MAX_DAILY_VENUE_CREATES", '10'))
 MAX_DAILY_INVITES = int(os.getenv("MAX_DAILY_INVITES", '50'))
@@ -239,9 +253,22 @@ CONCERT_RECS_PER_EMAIL = int(os.getenv("CONCERT_RECS_PER_EMAIL", '6'))
 INVITE_CODE_EXPIRATION_DAYS = int(os.getenv("INVITE_CODE_EXPIRATION_DAYS", '7'))
 MAX_FUTURE_CONCERT_WEEKS = int(os.getenv("MAX_FUTURE_CONCERT_WEEKS", '52'))
 MIN_LISTENERS_TO_IMPORT_MB = int(os.getenv("MIN_LISTENERS_TO_IMPORT_MB", '4'))
+# Where update_musicbrainz_data downloads the MusicBrainz/ListenBrainz dumps, and
+# how many of each it keeps there
+MUSICBRAINZ_DUMP_DIR = os.getenv("MUSICBRAINZ_DUMP_DIR", os.path.join(BASE_DIR, 'dumps'))
+MUSICBRAINZ_DUMPS_TO_KEEP = int(os.getenv("MUSICBRAINZ_DUMPS_TO_KEEP", '1'))
 MAX_USER_ARTISTS = 9
 MAX_CONTACTS_PER_MINUTE = int(os.getenv("MAX_CONTACTS_PER_MINUTE", '50'))
 WEEKLY_EMAIL_DAY = 6 # Sunday
+# Weekly email pipeline: subscribers loaded per database query, threads rendering
+# emails (mostly waiting on the MJML server), threads sending them (each with its
+# own connection), and the cap on messages per second across all sender threads.
+WEEKLY_EMAIL_CHUNK_SIZE = int(os.getenv("WEEKLY_EMAIL_CHUNK_SIZE", '1000'))
+WEEKLY_EMAIL_RENDER_WORKERS = int(os.getenv("WEEKLY_EMAIL_RENDER_WORKERS", '4'))
+WEEKLY_EMAIL_SENDER_THREADS = int(os.getenv("WEEKLY_EMAIL_SENDER_THREADS", '2'))
+WEEKLY_EMAIL_MAX_PER_SECOND = float(os.getenv("WEEKLY_EMAIL_MAX_PER_SECOND", '10'))
+# Subscribers per task when the weekly email is sent as shards (send_weekly_recs --sharded)
+WEEKLY_EMAIL_SHARD_SIZE = int(os.getenv("WEEKLY_EMAIL_SHARD_SIZE", '500'))
 
 
 # Logging
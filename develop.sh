@@ -186,6 +186,8 @@ nightly_tasks() {
     backup
     echo "CLEANING UP MEDIA FOLDER"
     invoke_manage cleanup_media
+    echo "WARMING SIMILARITY CACHE"
+    invoke_manage warm_similarity_cache
     echo "ROTATING LOGS"
     logrotate -v -s config/logrotate.status config/logrotate.conf
     echo "PRUNING TASK DATABASE"